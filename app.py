@@ -1,5 +1,6 @@
 import os
 import time
+import json
 import sys
 import pandas as pd
 import matplotlib
@@ -12,11 +13,24 @@ from dotenv import load_dotenv
 
 # Módulos do projeto
 from modules.sent_bayes import SentimentAnalyzer
-from modules.representacao_social import process_representacao_social
+from modules.representacao_social import (
+    process_representacao_social,
+    process_representacao_social_corpus,
+    process_similitude,
+    INDICES_SIMILITUDE,
+    process_questionario,
+    obter_tabela_evocacoes,
+    agregar_corpus,
+    modelo_do_formulario,
+    filtrar_tabela,
+    paginar_tabela
+)
 from modules.goose_scraper import scrape_links
 from modules.timeline_generator import TimelineGenerator, TimelineParser
-from modules.entity_finder import EntityClassifier, process_text
+from modules.entity_finder import EntityClassifier, process_text, VERSAO_SCHEMA_RESULTADO
+from modules.geo_clusters import agrupar_features, LIMIAR_AGRUPAMENTO, ZOOM_PADRAO
 from modules.prospect import TextProcessor, ScenarioClassifier
+from modules.model_registry import registry as model_registry
 
 
 # db_manager
@@ -27,6 +41,8 @@ from modules.db_manager import (
     insert_link_raspado,
     memoize_result,
     store_memo_result,
+    memoize_result_json,
+    store_memo_result_json,
     list_existing_dbs,
     save_entidades,
     save_timeline,
@@ -62,6 +78,15 @@ def fetch_last_ingested_content(db_path: str):
         conn.close()
     return None
 
+def dbs_do_escopo(escopo: str, db_path: str) -> list:
+    """
+    Lista os DBs cobertos por uma análise de corpus: o DB selecionado ('db')
+    ou todos os DBs existentes ('todos').
+    """
+    if escopo == "todos":
+        return [os.path.join(DB_FOLDER, f) for f in list_existing_dbs(DB_FOLDER)]
+    return [db_path]
+
 # >>>> Fim das Funções Auxiliares adicionadas <<<<
 
 load_dotenv()
@@ -84,6 +109,14 @@ os.makedirs(DB_FOLDER, exist_ok=True)
 
 entity_classifier = EntityClassifier(openai_api_key, serp_api_key)
 
+
+def _modelo_spacy():
+    """
+    Modelo spaCy compartilhado, resolvido só quando uma análise pede lemas.
+    """
+    return entity_classifier.nlp
+
+
 # Mantido: conteúdo compartilhado global, mas sem mais uso para texto
 shared_content = {
     "text": None,          # <--- Não mais utilizado
@@ -170,7 +203,8 @@ def save_to_db():
             topicos=shared_content["entities"].get("topicos", []),
             resumo=shared_content["entities"].get("resumo", ""),
             pessoas=shared_content["entities"].get("pessoas", []),
-            dados_mapa=shared_content["entities"].get("map_html", "")
+            dados_mapa=json.dumps(shared_content["entities"].get("geojson") or {},
+                                  ensure_ascii=False, separators=(",", ":"))
         )
 
     # Se existir timeline
@@ -446,32 +480,48 @@ def select_algorithm_and_generate():
 def process():
     """
     Processa Representações Sociais, recuperando do DB.
+    O campo 'escopo' define se a análise usa o último conteúdo ('ultimo'),
+    todo o DB selecionado ('db') ou todos os DBs existentes ('todos').
     """
     db_path = shared_content.get("selected_db")
     if not db_path:
         return jsonify({"error": "Nenhum DB selecionado"}), 400
 
-    last_entry = fetch_last_ingested_content(db_path)
-    if not last_entry:
-        return jsonify({"error": "Nenhum texto no DB"}), 400
-
-    text_for_analysis = last_entry["conteudo"]
-    if not text_for_analysis.strip():
-        return jsonify({"error": "Texto no DB está vazio"}), 400
+    escopo = request.form.get('escopo', 'ultimo')
+    if escopo in ("db", "todos"):
+        response_data = process_representacao_social_corpus(
+            dbs_do_escopo(escopo, db_path),
+            request.form,
+            app.config['UPLOAD_FOLDER'],
+            nlp=_modelo_spacy
+        )
+    else:
+        last_entry = fetch_last_ingested_content(db_path)
+        if not last_entry:
+            return jsonify({"error": "Nenhum texto no DB"}), 400
+
+        text_for_analysis = last_entry["conteudo"]
+        if not text_for_analysis.strip():
+            return jsonify({"error": "Texto no DB está vazio"}), 400
+
+        # Agora chamamos a função de representações sociais
+        response_data = process_representacao_social(
+            text_for_analysis,
+            request.form,
+            app.config['UPLOAD_FOLDER'],
+            db_path=db_path,
+            nlp=_modelo_spacy
+        )
 
-    # Agora chamamos a função de representações sociais
-    response_data = process_representacao_social(
-        text_for_analysis,
-        request.form,
-        app.config['UPLOAD_FOLDER']
-    )
     if not isinstance(response_data, dict):
         return jsonify({"error": "process_representacao_social não retornou dicionário."}), 500
 
     # Armazena metadados para posterior salvamento
     filters_aplicados = (request.form.get('stopwords', '') + " | " +
                          request.form.get('zone', '') + " | " +
-                         request.form.get('extra_filter', ''))
+                         request.form.get('extra_filter', '') + " | " +
+                         request.form.get('escopo', 'ultimo') + " | " +
+                         request.form.get('modo', 'formas'))
     shared_content["filtros_utilizados"] = filters_aplicados
     if "caminhos_imagens" in response_data:
         shared_content["caminhos_imagens"] = response_data["caminhos_imagens"]
@@ -480,6 +530,104 @@ def process():
 
     return response_data
 
+@app.route('/ingest_questionario', methods=['POST'])
+def ingest_questionario():
+    """
+    Recebe um questionário de associação livre (CSV/XLSX, um respondente por linha
+    ou uma evocação por linha) e executa a análise prototípica diretamente sobre ele.
+    """
+    uploaded_file = request.files.get('file')
+    if not uploaded_file or not uploaded_file.filename:
+        return jsonify({"error": "Nenhum arquivo de questionário enviado"}), 400
+
+    try:
+        response_data = process_questionario(
+            uploaded_file.stream,
+            uploaded_file.filename,
+            request.form,
+            app.config['UPLOAD_FOLDER']
+        )
+    except ImportError:
+        # Leitor da planilha ausente (openpyxl para .xlsx, xlrd para .xls)
+        return jsonify({"error": f"Formato de arquivo não suportado: {uploaded_file.filename}"}), 400
+    except (ValueError, KeyError) as e:
+        return jsonify({"error": f"Questionário inválido: {str(e)}"}), 400
+
+    shared_content["filtros_utilizados"] = (request.form.get('stopwords', '') + " | " +
+                                            request.form.get('zone', '') + " | " +
+                                            "questionario:" + uploaded_file.filename)
+    shared_content["caminhos_imagens"] = response_data["caminhos_imagens"]
+    shared_content["conteudos_tabelas"] = response_data["conteudos_tabelas"]
+    return response_data
+
+@app.route('/representacao_social/tabela', methods=['GET'])
+def representacao_social_tabela():
+    """
+    Retorna uma página da tabela de evocações em JSON, com ordenação e busca
+    feitas no servidor sobre a tabela base em cache.
+    Parâmetros: stopwords, zone, extra_filter, escopo, pagina, por_pagina,
+    ordenar_por, ordem e busca.
+    """
+    db_path = shared_content.get("selected_db")
+    if not db_path:
+        return jsonify({"error": "Nenhum DB selecionado"}), 400
+
+    aplicar_filtro = request.args.get('extra_filter', 'nao') == 'sim'
+    nlp = modelo_do_formulario(request.args, _modelo_spacy)
+    escopo = request.args.get('escopo', 'ultimo')
+    if escopo in ("db", "todos"):
+        resultado = agregar_corpus(
+            dbs_do_escopo(escopo, db_path), aplicar_filtro=aplicar_filtro, nlp=nlp
+        ).tabela()
+    else:
+        last_entry = fetch_last_ingested_content(db_path)
+        if not last_entry or not last_entry["conteudo"].strip():
+            return jsonify({"error": "Nenhum texto no DB"}), 400
+        resultado = obter_tabela_evocacoes(
+            last_entry["conteudo"], aplicar_filtro=aplicar_filtro, db_path=db_path, nlp=nlp
+        )
+
+    palavras, _ = filtrar_tabela(resultado, request.args)
+    return jsonify(paginar_tabela(
+        palavras,
+        pagina=request.args.get('pagina', 1, type=int),
+        por_pagina=request.args.get('por_pagina', 50, type=int),
+        ordenar_por=request.args.get('ordenar_por', 'frequencia'),
+        ordem=request.args.get('ordem', 'desc'),
+        busca=request.args.get('busca', '').strip()
+    ))
+
+@app.route('/representacao_social/similitude', methods=['GET'])
+def representacao_social_similitude():
+    """
+    Retorna, em JSON, a análise de similitude do último conteúdo do DB:
+    vértices (palavras mais centrais) e arestas da árvore geradora máxima.
+    Parâmetros: extra_filter, modo, stopwords, n_palavras, indice e min_coocorrencia.
+    """
+    db_path = shared_content.get("selected_db")
+    if not db_path:
+        return jsonify({"error": "Nenhum DB selecionado"}), 400
+
+    last_entry = fetch_last_ingested_content(db_path)
+    if not last_entry or not last_entry["conteudo"].strip():
+        return jsonify({"error": "Nenhum texto no DB"}), 400
+
+    try:
+        n_palavras = int(request.args.get('n_palavras', 50))
+        min_coocorrencia = int(request.args.get('min_coocorrencia', 1))
+    except ValueError:
+        return jsonify({"error": "n_palavras e min_coocorrencia devem ser inteiros"}), 400
+    if n_palavras < 1 or min_coocorrencia < 1:
+        return jsonify({"error": "n_palavras e min_coocorrencia devem ser maiores que zero"}), 400
+    if request.args.get('indice', 'cosseno') not in INDICES_SIMILITUDE:
+        return jsonify({"error": f"Índice inválido; use um de {', '.join(INDICES_SIMILITUDE)}"}), 400
+
+    try:
+        return jsonify(process_similitude(last_entry["conteudo"], request.args, nlp=_modelo_spacy))
+    except ValueError as e:
+        # Inclui o texto sem nenhuma palavra após os filtros
+        return jsonify({"error": str(e)}), 400
+
 @app.route('/identify_entities', methods=['POST'])
 def identify_entities():
     """
@@ -499,26 +647,48 @@ def identify_entities():
         return jsonify({"error": "Texto vazio no DB"}), 400
 
     try:
-        existing_result = memoize_result(db_path, "entity_finder", analysis_text)
-        if existing_result:
-            import json
-            try:
-                parsed = json.loads(existing_result)
-                shared_content["entities"] = parsed
-                return jsonify({"status": "cached", "entities": parsed})
-            except:
-                shared_content["entities"] = existing_result
-                return jsonify({"status": "cached", "entities": existing_result})
+        # Resultado memoizado como JSON comprimido; versões antigas do formato são recalculadas
+        existing_result = memoize_result_json(db_path, "entity_finder", analysis_text,
+                                              VERSAO_SCHEMA_RESULTADO)
+        if existing_result is not None:
+            shared_content["entities"] = existing_result
+            return jsonify({"status": "cached", "entities": existing_result})
 
         # Se não existe, processamos
-        result_obj = process_text(analysis_text, entity_classifier)  # dict ou similar
+        result_obj = process_text(analysis_text, entity_classifier)
         shared_content["entities"] = result_obj
-        store_memo_result(db_path, "entity_finder", analysis_text, str(result_obj))
+        store_memo_result_json(db_path, "entity_finder", analysis_text, result_obj,
+                               VERSAO_SCHEMA_RESULTADO)
         return jsonify({"status": "success", "entities": result_obj})
     except Exception as e:
         print(f"Erro durante a identificação de entidades: {e}")
         return jsonify({"error": "Erro ao identificar entidades"}), 500
 
+@app.route('/entities/geojson', methods=['GET'])
+def entities_geojson():
+    """
+    GeoJSON das localizações identificadas, agrupadas no servidor por grade.
+    Parâmetros opcionais: zoom (nível do mapa) e bbox ("oeste,sul,leste,norte").
+    Sem zoom, os pontos só são agrupados se passarem de LIMIAR_AGRUPAMENTO.
+    """
+    entities = shared_content.get("entities")
+    colecao = entities.get("geojson") if isinstance(entities, dict) else None
+    if not colecao:
+        return jsonify({"type": "FeatureCollection", "features": []})
+
+    try:
+        zoom = request.args.get("zoom", type=int)
+        bbox = request.args.get("bbox")
+        bbox = tuple(float(v) for v in bbox.split(",")) if bbox else None
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError("bbox deve ter 4 valores")
+    except ValueError as e:
+        return jsonify({"error": f"Parâmetros inválidos: {e}"}), 400
+
+    if zoom is None and bbox is None and len(colecao["features"]) <= LIMIAR_AGRUPAMENTO:
+        return jsonify(colecao)
+    return jsonify(agrupar_features(colecao, zoom=ZOOM_PADRAO if zoom is None else zoom, bbox=bbox))
+
 @app.route('/generate_timeline', methods=['POST'])
 def generate_timeline():
     """
@@ -623,6 +793,24 @@ def generate_cenarios():
     
     return jsonify({"html": html_resp})
 
+@app.route('/models', methods=['GET'])
+def models_report():
+    """
+    Relatório dos modelos compartilhados: carregados ou não, tempo de carga e memória.
+    """
+    return jsonify(model_registry.memory_report())
+
+@app.route('/models/unload', methods=['POST'])
+def models_unload():
+    """
+    Descarrega explicitamente um modelo compartilhado (campo 'name').
+    """
+    name = request.form.get('name', '')
+    if not name:
+        return jsonify({"error": "Nenhum modelo informado"}), 400
+    unloaded = model_registry.unload(name)
+    return jsonify({"status": "success" if unloaded else "not_loaded", "name": name})
+
 @app.route('/api/', methods=['POST'])
 def receive_dom():
     try:
@@ -2,6 +2,26 @@ import os
 import sqlite3
 import hashlib
 import time
+import json
+import gzip
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # dependência opcional: sem ela, resultados são comprimidos com gzip
+    zstandard = None
+
+# Compressão dos resultados memoizados em BLOB: "zstd", "gzip" ou "nenhuma"
+MEMO_COMPRESSAO = os.getenv("MEMO_COMPRESSION", "zstd" if zstandard else "gzip")
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_GZIP_MAGIC = b"\x1f\x8b"
+
+# Erros de um BLOB truncado ou corrompido (gzip levanta EOFError, BadGzipFile/OSError ou
+# zlib.error; JSON/UTF-8 inválido, ValueError); nesses casos o resultado é recalculado
+_ERROS_DESSERIALIZACAO = (ValueError, OSError, EOFError, zlib.error) + (
+    (zstandard.ZstdError,) if zstandard is not None else ()
+)
 
 def get_db_path(db_folder: str, timestamp: str) -> str:
     """
@@ -63,7 +83,9 @@ def create_db_if_not_exists(db_path: str):
                 pessoas_organizacoes TEXT,
                 dados_mapa TEXT,
                 timestamp TEXT NOT NULL,
-                conteudo TEXT
+                conteudo TEXT,
+                resultado_blob BLOB,
+                versao_schema INTEGER
             )
         """)
 
@@ -164,6 +186,8 @@ def create_db_if_not_exists(db_path: str):
             except:
                 pass
 
+        _garantir_colunas_resultado(cursor, "entity_finder")
+
         # timeline
         for col in ["prompt", "texto_analisado", "xml_final", "conteudo"]:
             try:
@@ -313,6 +337,120 @@ def store_memo_result(db_path: str, table_name: str, unique_content: str, proces
     if not existing:
         insert_content(db_path, table_name, hash_val, processed_output)
 
+def _garantir_colunas_resultado(cursor, table_name: str):
+    """
+    Adiciona (se faltarem) as colunas do resultado serializado: resultado_blob e versao_schema.
+    """
+    for col, tipo in [("resultado_blob", "BLOB"), ("versao_schema", "INTEGER")]:
+        try:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {col} {tipo}")
+        except sqlite3.OperationalError:
+            pass
+
+def serializar_resultado(resultado, compressao: str = None) -> bytes:
+    """
+    Serializa um resultado em JSON (UTF-8), comprimido com zstd ou gzip.
+    O formato é reconhecido na leitura pelos bytes iniciais, sem coluna extra.
+    """
+    compressao = compressao or MEMO_COMPRESSAO
+    dados = json.dumps(resultado, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if compressao == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(dados)
+    if compressao in ("zstd", "gzip"):
+        return gzip.compress(dados, compresslevel=6)
+    return dados
+
+def desserializar_resultado(blob: bytes):
+    """
+    Inverso de serializar_resultado: detecta zstd/gzip/JSON puro e decodifica.
+    """
+    blob = bytes(blob)
+    if blob.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError("Resultado comprimido com zstd, mas o pacote 'zstandard' não está instalado")
+        blob = zstandard.ZstdDecompressor().decompress(blob)
+    elif blob.startswith(_GZIP_MAGIC):
+        blob = gzip.decompress(blob)
+    return json.loads(blob.decode("utf-8"))
+
+def memoize_result_json(db_path: str, table_name: str, unique_content: str, versao_schema: int):
+    """
+    Versão estruturada de memoize_result: retorna o objeto desserializado guardado
+    para 'unique_content', ou None se não houver resultado na versão de schema pedida
+    (registros antigos, em texto, são ignorados e recalculados).
+    """
+    if not db_path or not os.path.isfile(db_path):
+        return None
+
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute(f"""
+            SELECT resultado_blob FROM {table_name}
+            WHERE hash = ? AND versao_schema = ? AND resultado_blob IS NOT NULL
+            ORDER BY id DESC LIMIT 1
+        """, (calculate_hash(unique_content), versao_schema)).fetchone()
+    except sqlite3.OperationalError:
+        # DB anterior às colunas de resultado serializado
+        return None
+    finally:
+        conn.close()
+    if not row:
+        return None
+    try:
+        return desserializar_resultado(row[0])
+    except _ERROS_DESSERIALIZACAO as e:
+        print(f"Erro ao desserializar resultado memoizado de {table_name}: {e}")
+        return None
+
+def store_memo_result_json(db_path: str, table_name: str, unique_content: str, resultado,
+                           versao_schema: int, compressao: str = None):
+    """
+    Armazena 'resultado' (serializável em JSON) como BLOB comprimido, com a versão do schema.
+    """
+    if not db_path:
+        return
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        _garantir_colunas_resultado(cursor, table_name)
+        cursor.execute(f"""
+            INSERT INTO {table_name} (hash, conteudo, resultado_blob, versao_schema, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        """, (
+            calculate_hash(unique_content), None,
+            sqlite3.Binary(serializar_resultado(resultado, compressao)),
+            versao_schema, time.strftime('%Y%m%d_%H%M%S')
+        ))
+        conn.commit()
+    finally:
+        conn.close()
+
+def iter_conteudos_ingestao(db_path: str, a_partir_de_id: int = 0, tamanho_lote: int = 100):
+    """
+    Percorre a tabela conteudos_ingestao em lotes, sem carregar todo o DB em memória.
+    Gera listas de tuplas (id, hash, conteudo) com id maior que 'a_partir_de_id'.
+    """
+    if not db_path or not os.path.isfile(db_path):
+        return
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, hash, conteudo
+            FROM conteudos_ingestao
+            WHERE id > ?
+            ORDER BY id
+        """, (a_partir_de_id,))
+        while True:
+            lote = cursor.fetchmany(tamanho_lote)
+            if not lote:
+                break
+            yield lote
+    finally:
+        conn.close()
+
 def insert_api_call(db_path: str, api_name: str, parametros: str, resposta: str):
     """
     Exemplo de registro de chamada à API.
@@ -0,0 +1,99 @@
+import re
+from spacy.tokens import Doc
+
+# Componentes necessários para cada tarefa; os demais são desativados no nlp.pipe.
+# A segmentação usa o senter (desativado por padrão no pt_core_news_sm, com tok2vec
+# próprio), bem mais leve que o parser de dependências.
+COMPONENTES_POR_TAREFA = {
+    "entidades": {"tok2vec", "transformer", "ner", "entity_ruler"},
+    "frases": {"senter", "sentencizer"},
+    "lemas": {"tok2vec", "transformer", "tagger", "morphologizer", "attribute_ruler", "lemmatizer"},
+}
+
+# Segmentação pelo parser, só para modelos sem senter nem sentencizer
+COMPONENTES_FRASES_PARSER = {"tok2vec", "transformer", "parser"}
+
+# Tamanho máximo de um bloco enviado ao spaCy (bem abaixo do nlp.max_length padrão de 1.000.000)
+MAX_CHARS_BLOCO = 100_000
+
+_PARAGRAFO_RE = re.compile(r"\n\s*\n")
+_QUEBRA_RE = re.compile(r"(?<=[.!?])\s+|\n")
+
+
+def dividir_em_blocos(text, max_chars=MAX_CHARS_BLOCO):
+    """
+    Divide o texto em blocos por parágrafo, agrupando parágrafos curtos até 'max_chars'.
+    Parágrafos maiores que o limite são cortados em fim de frase (ou, em último caso,
+    em espaço). A concatenação dos blocos reproduz exatamente o texto original.
+    :return: Lista de (deslocamento_inicial, bloco).
+    """
+    # Fronteiras candidatas: fim de cada parágrafo (o separador fica no bloco anterior)
+    fronteiras = [m.end() for m in _PARAGRAFO_RE.finditer(text)] + [len(text)]
+    blocos = []
+    inicio = 0
+    ultimo_corte = 0
+    for fim in fronteiras:
+        if fim - inicio <= max_chars:
+            ultimo_corte = fim
+            continue
+        if ultimo_corte > inicio:
+            blocos.append((inicio, text[inicio:ultimo_corte]))
+            inicio = ultimo_corte
+        # Parágrafo isolado ainda grande demais: corta em fim de frase
+        while fim - inicio > max_chars:
+            janela = text[inicio:inicio + max_chars]
+            cortes = [m.end() for m in _QUEBRA_RE.finditer(janela)]
+            corte = cortes[-1] if cortes else (janela.rfind(" ") + 1 or max_chars)
+            blocos.append((inicio, text[inicio:inicio + corte]))
+            inicio += corte
+        ultimo_corte = fim
+    if inicio < len(text):
+        blocos.append((inicio, text[inicio:]))
+    return blocos
+
+
+def componentes_desativados(nlp, tarefas):
+    """
+    Nomes dos componentes ativos do pipeline que nenhuma das tarefas pedidas usa.
+    """
+    necessarios = set().union(*(COMPONENTES_POR_TAREFA[t] for t in tarefas))
+    if "frases" in tarefas and not COMPONENTES_POR_TAREFA["frases"] & set(nlp.component_names):
+        necessarios |= COMPONENTES_FRASES_PARSER
+    return [nome for nome in nlp.pipe_names if nome not in necessarios]
+
+
+def processar_documento(nlp, text, tarefas=("entidades", "frases"), batch_size=32,
+                        n_process=1, max_chars=MAX_CHARS_BLOCO):
+    """
+    Processa textos de qualquer tamanho: divide em blocos por parágrafo, roda nlp.pipe
+    só com os componentes que as tarefas exigem e costura os blocos num único Doc.
+    Como os blocos reproduzem o texto original, doc.text == text e os spans
+    (doc.ents, doc.sents) têm deslocamentos globais corretos.
+    Se o senter do modelo estiver desativado, ele é aplicado diretamente aos docs
+    (neste processo), sem alterar o pipeline compartilhado entre threads.
+    :param tarefas: Subconjunto de COMPONENTES_POR_TAREFA ("entidades", "frases", "lemas").
+    :return: spacy.tokens.Doc
+    """
+    blocos = [bloco for _, bloco in dividir_em_blocos(text, max_chars)]
+    if not blocos:
+        return nlp.make_doc(text)
+    docs = list(nlp.pipe(
+        blocos,
+        batch_size=batch_size,
+        n_process=n_process,
+        disable=componentes_desativados(nlp, tarefas)
+    ))
+    if "frases" in tarefas and "senter" in nlp.disabled:
+        docs = list(nlp.get_pipe("senter").pipe(docs, batch_size=batch_size))
+    if len(docs) == 1:
+        return docs[0]
+    return Doc.from_docs(docs, ensure_whitespace=False)
+
+
+def extrair_frases(nlp, text, **kwargs):
+    """
+    Só segmentação: retorna [(texto, inicio, fim)] com deslocamentos no texto original,
+    ignorando frases compostas só de espaços (restos das quebras entre blocos).
+    """
+    doc = processar_documento(nlp, text, tarefas=("frases",), **kwargs)
+    return [(sent.text, sent.start_char, sent.end_char) for sent in doc.sents if sent.text.strip()]
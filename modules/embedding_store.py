@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import threading
+import numpy as np
+from modules.db_manager import calculate_hash
+from modules.model_registry import get_model
+from modules.persistent_cache import ativar_wal, LOTE_CONSULTA
+
+# Diretório dos vetores de frases, compartilhado por todos os DBs de projeto
+DEFAULT_EMBEDDINGS_DIR = os.getenv("EMBEDDINGS_PATH", "./static/cache/embeddings")
+
+# Frases codificadas por chamada ao modelo (já ordenadas por tamanho)
+TAMANHO_LOTE = 64
+
+
+class EmbeddingStore:
+    """
+    Vetores de frases persistidos em disco: um arquivo float16 só de acréscimo
+    (lido via np.memmap) e um índice SQLite hash da frase -> linha do arquivo.
+    Só as frases nunca vistas passam pelo modelo; as demais são lidas do arquivo.
+    O arquivo pode ser compartilhado por vários processos: o acréscimo acontece
+    dentro da transação de escrita do índice, que serializa os escritores.
+    """
+    def __init__(self, modelo="sentence_encoder", diretorio=None, tamanho_lote=TAMANHO_LOTE):
+        self.modelo = modelo
+        self.diretorio = diretorio or DEFAULT_EMBEDDINGS_DIR
+        self.tamanho_lote = tamanho_lote
+        self.vetores_path = os.path.join(self.diretorio, f"{modelo}.f16")
+        self.db_path = os.path.join(self.diretorio, f"{modelo}.sqlite")
+        self._mapa = None
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_db(self):
+        os.makedirs(self.diretorio, exist_ok=True)
+        conn = self._connect()
+        try:
+            ativar_wal(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS indice (
+                    hash TEXT PRIMARY KEY,
+                    linha INTEGER NOT NULL
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    chave TEXT PRIMARY KEY,
+                    valor INTEGER NOT NULL
+                )
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _meta(conn):
+        meta = dict(conn.execute("SELECT chave, valor FROM meta").fetchall())
+        return meta.get("linhas", 0), meta.get("dimensao")
+
+    def _linhas(self, conn, hashes):
+        """
+        {hash: linha} para as frases já armazenadas.
+        """
+        linhas = {}
+        for i in range(0, len(hashes), LOTE_CONSULTA):
+            lote = hashes[i:i + LOTE_CONSULTA]
+            linhas.update(conn.execute(
+                f"SELECT hash, linha FROM indice WHERE hash IN ({', '.join('?' * len(lote))})", lote
+            ).fetchall())
+        return linhas
+
+    def _vetores(self, linhas, total, dimensao):
+        """
+        Lê as linhas pedidas do arquivo mapeado em memória (reabrindo o mapa se ele cresceu).
+        """
+        with self._lock:
+            if self._mapa is None or self._mapa.shape != (total, dimensao):
+                self._mapa = np.memmap(self.vetores_path, dtype=np.float16, mode="r",
+                                       shape=(total, dimensao))
+            return np.asarray(self._mapa[linhas], dtype=np.float32)
+
+    def _codificar_novas(self, frases):
+        """
+        Codifica as frases em lotes ordenados por tamanho (menos preenchimento por lote).
+        :return: np.ndarray float32 na ordem original.
+        """
+        encoder = get_model(self.modelo)
+        ordem = sorted(range(len(frases)), key=lambda i: len(frases[i]))
+        partes = []
+        for i in range(0, len(ordem), self.tamanho_lote):
+            lote = [frases[j] for j in ordem[i:i + self.tamanho_lote]]
+            partes.append(np.asarray(encoder.encode(lote, batch_size=len(lote)), dtype=np.float32))
+        vetores = np.empty((len(frases), partes[0].shape[1]), dtype=np.float32)
+        vetores[ordem] = np.vstack(partes)
+        return vetores
+
+    def _acrescentar(self, hashes, vetores):
+        """
+        Grava os vetores no fim do arquivo e registra suas linhas no índice, na mesma
+        transação. Frases gravadas por outro processo nesse meio-tempo são ignoradas.
+        Se o processo cair entre a escrita e o commit, o lixo no fim do arquivo é
+        sobrescrito no próximo acréscimo.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            total, dimensao = self._meta(conn)
+            if dimensao is not None and dimensao != vetores.shape[1]:
+                raise ValueError(f"Dimensão {vetores.shape[1]} difere da armazenada ({dimensao}) "
+                                 f"em {self.vetores_path}")
+            ja_gravadas = self._linhas(conn, hashes)
+            novas = [i for i, h in enumerate(hashes) if h not in ja_gravadas]
+            if novas:
+                dados = vetores[novas].astype(np.float16)
+                modo = "r+b" if os.path.exists(self.vetores_path) else "wb"
+                with open(self.vetores_path, modo) as f:
+                    f.seek(total * dados.shape[1] * dados.itemsize)
+                    f.write(dados.tobytes())
+                    f.truncate()
+                conn.executemany("INSERT INTO indice (hash, linha) VALUES (?, ?)",
+                                 [(hashes[i], total + k) for k, i in enumerate(novas)])
+                conn.executemany("INSERT OR REPLACE INTO meta (chave, valor) VALUES (?, ?)",
+                                 [("linhas", total + len(novas)), ("dimensao", int(dados.shape[1]))])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def codificar(self, frases):
+        """
+        Vetores das frases (na ordem recebida), codificando só as que não estão no disco.
+        :param frases: Lista de strings.
+        :return: np.ndarray float32 (n_frases, dimensão).
+        """
+        if not frases:
+            return np.empty((0, 0), dtype=np.float32)
+        hash_por_frase = {f: calculate_hash(f) for f in frases}
+        unicas = list(hash_por_frase)
+        hashes = [hash_por_frase[f] for f in unicas]
+
+        conn = self._connect()
+        try:
+            linhas = self._linhas(conn, hashes)
+            total, dimensao = self._meta(conn)
+        finally:
+            conn.close()
+
+        faltando = [i for i, h in enumerate(hashes) if h not in linhas]
+        vetores = {}
+        if faltando:
+            novos = self._codificar_novas([unicas[i] for i in faltando])
+            self._acrescentar([hashes[i] for i in faltando], novos)
+            vetores.update(zip((unicas[i] for i in faltando), novos))
+        if linhas:
+            conhecidas = [f for f, h in zip(unicas, hashes) if h in linhas]
+            lidos = self._vetores([linhas[hash_por_frase[f]] for f in conhecidas], total, dimensao)
+            vetores.update(zip(conhecidas, lidos))
+        print(f">>> [EMBEDDINGS] {len(unicas) - len(faltando)} de {len(unicas)} frase(s) já codificadas.")
+        return np.vstack([vetores[f] for f in frases])
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(modelo="sentence_encoder"):
+    """
+    Instância compartilhada do EmbeddingStore para o modelo.
+    """
+    with _stores_lock:
+        if modelo not in _stores:
+            _stores[modelo] = EmbeddingStore(modelo)
+        return _stores[modelo]
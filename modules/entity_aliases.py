@@ -0,0 +1,154 @@
+from modules.gazetteer import normalizar_nome
+
+# Partículas ignoradas na comparação por tokens ("Lula da Silva" ~ "Lula Silva")
+PARTICULAS = frozenset({"da", "de", "do", "das", "dos", "e", "di", "del", "van", "von"})
+
+# Similaridade mínima (coeficiente de Dice sobre trigramas) para unir grafias próximas
+LIMIAR_SIMILARIDADE = 0.75
+
+# Tamanho mínimo de um nome de uma palavra para ser unido por contenção ("Lula" -> "Lula da Silva")
+MIN_CHARS_CONTENCAO = 3
+
+# Trigramas presentes em mais nomes que isso (ou 5% deles) não geram pares candidatos
+MAX_POSTAGEM = 50
+
+
+def trigramas(nome_normalizado):
+    """
+    Conjunto de trigramas de caracteres, com espaços de borda.
+    """
+    texto = f"  {nome_normalizado} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def tokens_relevantes(nome_normalizado):
+    return frozenset(t for t in nome_normalizado.split() if t not in PARTICULAS)
+
+
+class _UniaoBusca:
+    def __init__(self, n):
+        self.pai = list(range(n))
+
+    def raiz(self, i):
+        while self.pai[i] != i:
+            self.pai[i] = self.pai[self.pai[i]]
+            i = self.pai[i]
+        return i
+
+    def unir(self, a, b):
+        ra, rb = self.raiz(a), self.raiz(b)
+        if ra != rb:
+            self.pai[rb] = ra
+
+
+def agrupar_variantes(nomes, rotulos=None, contagens=None, limiar=LIMIAR_SIMILARIDADE):
+    """
+    Agrupa grafias da mesma entidade e escolhe uma forma canônica por grupo.
+    Regras de união:
+      1) mesmo nome normalizado (caixa/acentos);
+      2) Dice de trigramas >= limiar (candidatos vindos de um índice invertido de
+         trigramas), desde que as palavras difiram em no máximo uma, também parecida;
+      3) contenção de palavras: "Lula" e "Lula da Silva" entram no grupo de
+         "Luiz Inácio Lula da Silva" se todos os nomes que os contêm estiverem num
+         único grupo; se estiverem em grupos diferentes ("Silva"), ficam sozinhos.
+    Nomes cujos conjuntos de rótulos do spaCy não se cruzam nunca são unidos.
+    :param rotulos: Opcional, {nome: conjunto de rótulos}.
+    :param contagens: Opcional, {nome: ocorrências}, usado no desempate da forma canônica.
+    :return: {nome: forma canônica}
+    """
+    nomes = list(dict.fromkeys(nomes))
+    rotulos = rotulos or {}
+    contagens = contagens or {}
+    normalizados = [normalizar_nome(n) for n in nomes]
+    tokens = [tokens_relevantes(n) for n in normalizados]
+    grams = [trigramas(n) for n in normalizados]
+    uniao = _UniaoBusca(len(nomes))
+
+    def compativeis(i, j):
+        ri, rj = rotulos.get(nomes[i]), rotulos.get(nomes[j])
+        return not ri or not rj or bool(ri & rj)
+
+    def dice(a, b):
+        return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+    def grafias_proximas(i, j):
+        # Mesmo conjunto de palavras, ou uma única palavra diferente e parecida ("Bolsonaro"/"Bolsonar")
+        so_i, so_j = tokens[i] - tokens[j], tokens[j] - tokens[i]
+        if not so_i and not so_j:
+            return True
+        if len(so_i) != 1 or len(so_j) != 1:
+            return False
+        return dice(trigramas(next(iter(so_i))), trigramas(next(iter(so_j)))) >= limiar
+
+    # Índice invertido trigrama -> nomes. Trigramas muito frequentes (" da", "ilv"...)
+    # não geram candidatos; a similaridade dos candidatos é calculada exatamente.
+    indice = {}
+    for i, gs in enumerate(grams):
+        for g in gs:
+            indice.setdefault(g, []).append(i)
+    max_postagem = max(MAX_POSTAGEM, len(nomes) // 20)
+
+    for i, gs in enumerate(grams):
+        candidatos = {j for g in gs if len(indice[g]) <= max_postagem for j in indice[g] if j > i}
+        for j in candidatos:
+            if not compativeis(i, j):
+                continue
+            if normalizados[i] == normalizados[j] or (
+                    dice(gs, grams[j]) >= limiar and grafias_proximas(i, j)):
+                uniao.unir(i, j)
+
+    # Contenção de palavras: do nome mais longo para o mais curto, um nome entra no grupo
+    # dos nomes que o contêm apenas se todos eles já estiverem num único grupo
+    # ("Lula" -> "Lula da Silva" -> "Luiz Inácio Lula da Silva"; "Silva" fica sozinho).
+    por_token = {}
+    for j, toks in enumerate(tokens):
+        for t in toks:
+            por_token.setdefault(t, []).append(j)
+    for i in sorted(range(len(nomes)), key=lambda i: -len(tokens[i])):
+        toks = tokens[i]
+        if not toks or (len(toks) == 1 and len(normalizados[i]) < MIN_CHARS_CONTENCAO):
+            continue
+        raro = min(toks, key=lambda t: len(por_token[t]))
+        contem = [j for j in por_token[raro] if toks < tokens[j] and compativeis(i, j)]
+        if contem and len({uniao.raiz(j) for j in contem}) == 1:
+            uniao.unir(contem[0], i)
+
+    grupos = {}
+    for i in range(len(nomes)):
+        grupos.setdefault(uniao.raiz(i), []).append(i)
+
+    canonicos = {}
+    for membros in grupos.values():
+        # Forma canônica: mais palavras, depois mais citada, com maiúsculas, mais longa
+        melhor = max(membros, key=lambda i: (len(tokens[i]), contagens.get(nomes[i], 0),
+                                             nomes[i] != nomes[i].lower(), len(nomes[i])))
+        for i in membros:
+            canonicos[nomes[i]] = nomes[melhor]
+    return canonicos
+
+
+def resolver_aliases(indice):
+    """
+    Funde no índice de menções (ver entity_finder.indexar_mencoes) as variantes de
+    uma mesma entidade sob a forma canônica, acumulando menções e rótulos.
+    Cada entrada ganha a lista 'aliases' com as demais grafias encontradas.
+    :return: Novo índice, no mesmo formato.
+    """
+    entidades = indice["entidades"]
+    canonicos = agrupar_variantes(
+        list(entidades),
+        rotulos={ent: info["rotulos"] for ent, info in entidades.items()},
+        contagens={ent: len(info["mencoes"]) for ent, info in entidades.items()}
+    )
+    fundidas = {}
+    for ent, info in entidades.items():
+        canonico = canonicos[ent]
+        destino = fundidas.setdefault(canonico, {"rotulos": set(), "mencoes": [], "aliases": []})
+        destino["rotulos"] |= info["rotulos"]
+        destino["mencoes"].extend(info["mencoes"])
+        if ent != canonico:
+            destino["aliases"].append(ent)
+    for info in fundidas.values():
+        info["mencoes"].sort()
+    print(f">>> [ALIASES] {len(entidades)} grafia(s) agrupadas em {len(fundidas)} entidade(s).")
+    return {**indice, "entidades": fundidas}
@@ -1,40 +1,215 @@
-import spacy
-from summarizer import Summarizer
 import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-import numpy as np
-import folium
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 import time
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 import json
+import os
 from openai import OpenAI
+from modules.model_registry import get_model
+from modules.persistent_cache import PersistentCache
+from modules.gazetteer import Gazetteer, normalizar_nome
+from modules.stage_executor import Etapa, StageExecutor
+from modules.doc_processing import processar_documento
+from modules.summarization import resumir, MODO_RESUMO_PADRAO, RESUMO_EM_PROCESSO
+from modules.topic_engine import extrair_topicos
+from modules.geo_clusters import feature_collection
+from modules.knowledge_base import EntityKnowledgeBase, ORIGENS_CONFIAVEIS
+from modules.entity_aliases import resolver_aliases
+
+PLACEHOLDER_IMAGEM = "/static/img/placeholder.png"
+
+# Versão do formato do dicionário retornado por process_text; ao mudar o formato,
+# incremente para que resultados memoizados antigos sejam recalculados
+VERSAO_SCHEMA_RESULTADO = 3
+
+# Rótulos do NER do spaCy (pt_core_news_sm) que já determinam o tipo da entidade; MISC fica para o LLM
+ROTULOS_SPACY = {"PER": "pessoa", "ORG": "organização", "LOC": "localização"}
+
+# Tabela local de apelidos: {"nome": "tipo"} ou {"nome": {"tipo": ..., "local": ...}}
+DEFAULT_ALIASES_PATH = os.getenv("ENTITY_ALIASES_PATH", "./static/cache/aliases_entidades.json")
+
+
+def carregar_aliases(caminho=None):
+    """
+    Lê a tabela local de apelidos de entidades, indexada pelo nome normalizado.
+    Retorna {} se o arquivo não existir ou for inválido.
+    """
+    caminho = caminho or DEFAULT_ALIASES_PATH
+    if not os.path.isfile(caminho):
+        return {}
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            dados = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Erro ao carregar tabela de apelidos {caminho}: {e}")
+        return {}
+    aliases = {}
+    for nome, valor in dados.items():
+        if isinstance(valor, str):
+            valor = {"tipo": valor, "local": None}
+        if valor.get("tipo") in ("pessoa", "organização", "localização"):
+            aliases[normalizar_nome(nome)] = {"tipo": valor["tipo"], "local": valor.get("local")}
+    return aliases
+
+
+def classificar_localmente(rotulos_por_entidade, aliases):
+    """
+    Primeira camada da classificação, sem chamadas externas.
+    Uma entidade é tipada localmente se estiver na tabela de apelidos ou se todas as
+    suas ocorrências receberam o mesmo rótulo PER/ORG/LOC do spaCy; as demais
+    (MISC ou rótulos conflitantes) são ambíguas.
+    :param rotulos_por_entidade: {entidade: conjunto de rótulos spaCy das ocorrências}
+    :param aliases: Tabela de apelidos retornada por carregar_aliases.
+    :return: ({entidade: {"tipo":..., "local":..., "origem": "apelidos"|"spacy"}}, [entidades ambíguas])
+    """
+    classificadas = {}
+    ambiguas = []
+    for ent, rotulos in rotulos_por_entidade.items():
+        alias = aliases.get(normalizar_nome(ent))
+        if alias:
+            classificadas[ent] = {**alias, "origem": "apelidos"}
+        elif len(rotulos) == 1 and next(iter(rotulos)) in ROTULOS_SPACY:
+            classificadas[ent] = {"tipo": ROTULOS_SPACY[next(iter(rotulos))], "local": None, "origem": "spacy"}
+        else:
+            ambiguas.append(ent)
+    return classificadas, ambiguas
 
 class EntityClassifier:
     """
     Classe responsável por gerenciar as etapas de classificação em lote (etapa 1)
     e de busca de imagem (etapa 2), utilizando a SerpAPI como abordagem principal.
     """
-    def __init__(self, openai_api_key, serp_api_key):
+    def __init__(self, openai_api_key, serp_api_key, cache_path=None, gazetteer_path=None,
+                 aliases_path=None, kb_path=None):
         self.openai_client = OpenAI(api_key=openai_api_key)
-        self.nlp = spacy.load("pt_core_news_sm")
-        self.bert_model = Summarizer()
-        self.sia = SentimentIntensityAnalyzer()
         self.geolocator = Nominatim(user_agent="my_flask_app/1.0")
         self.serp_api_key = serp_api_key
-        # Cache para imagens e evitar múltiplas chamadas duplicadas
-        self._image_cache = {}
+        # Cache persistente (SQLite + memória) de imagens, compartilhado entre processos.
+        # Placeholders (nada encontrado / erro) ficam em cache por menos tempo.
+        self._image_cache = PersistentCache("serpapi_imagens", db_path=cache_path, ttl=30 * 24 * 3600)
+        self.image_negative_ttl = 24 * 3600
+        self.image_error_ttl = 3600
+        # Geocodificação: gazetteer local primeiro, depois cache persistente, e só então Nominatim
+        self.gazetteer = Gazetteer(gazetteer_path)
+        self._geocode_cache = PersistentCache("geocode", db_path=cache_path, ttl=180 * 24 * 3600)
+        self.geocode_negative_ttl = 7 * 24 * 3600
+        # Classificação por entidade (chave: nome normalizado); só entidades novas vão à OpenAI
+        self._classif_cache = PersistentCache("classificacao_entidades", db_path=cache_path, ttl=90 * 24 * 3600)
+        self.classificacao_negative_ttl = 7 * 24 * 3600
+        self.classificacao_lote = 40
+        self.max_classificacao_workers = 4
+        self.classificacao_timeout = 120
+        # Base de conhecimento compartilhada entre projetos: consultada antes de
+        # classificar, buscar imagens e geocodificar; enriquecida ao fim de cada análise
+        self.base_conhecimento = EntityKnowledgeBase(kb_path)
+        # Tipagem local (rótulos do spaCy + apelidos) antes do LLM
+        self.tipagem_local = True
+        self.aliases = carregar_aliases(aliases_path)
+        # Resumo: "bert" ou "rapido" (TextRank); o BERT roda no worker do pool de processos
+        # (não disputa o GIL com as demais etapas e o modelo não ocupa memória neste processo)
+        self.resumo_modo = MODO_RESUMO_PADRAO
+        self.resumo_em_processo = RESUMO_EM_PROCESSO
+        self.ultimos_tempos = {}
+        # spaCy em blocos por parágrafo via nlp.pipe (textos maiores que nlp.max_length)
+        self.spacy_batch_size = 32
+        self.spacy_n_process = 1
+        # Sessão HTTP com keep-alive, compartilhada pelas buscas concorrentes
+        self.http_timeout = (5, 15)
+        self.max_image_workers = 8
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_image_workers)
+        self._http.mount("https://", adapter)
+
+    # Modelos pesados vêm do registro compartilhado, carregados sob demanda
+    @property
+    def nlp(self):
+        return get_model("spacy")
+
+    @property
+    def bert_model(self):
+        return get_model("summarizer")
+
+    @property
+    def sia(self):
+        return get_model("vader")
 
     def classificar_em_bloco(self, entidades_unicas):
         """
-        Faz uma única chamada à API da OpenAI para classificar uma lista de entidades.
-        Retorna um dicionário {entidade: {"tipo":..., "local":...}}.
+        Classifica uma lista de entidades, consultando primeiro o cache persistente
+        por entidade. Só as entidades nunca vistas vão para a OpenAI, divididas em
+        lotes de até 'classificacao_lote' itens enviados em paralelo; um lote com
+        resposta inválida é descartado sem afetar os demais. Entidades que o modelo
+        omitir são guardadas como "desconhecido", com TTL curto.
+        Retorna um dicionário {entidade: {"tipo":..., "local":..., "origem": "llm"}}.
         """
         print(">>> [ETAPA 1] classificar_entidades_em_bloco: Iniciando classificação em lote...")
 
+        classif_dict = {}
+        pendentes = []
+        vistos = set()
+        for ent in entidades_unicas:
+            chave = normalizar_nome(ent)
+            if not chave or chave in vistos:
+                continue
+            vistos.add(chave)
+            em_cache = self._classif_cache.get(chave, PersistentCache.MISSING)
+            if em_cache is PersistentCache.MISSING:
+                pendentes.append(ent)
+            else:
+                classif_dict[ent] = {"origem": "llm", **em_cache}
+
+        print(f">>> [ETAPA 1] {len(classif_dict)} entidade(s) em cache, {len(pendentes)} para a API.")
+        if not pendentes:
+            return classif_dict
+
+        tamanho = self.classificacao_lote
+        lotes = [pendentes[i:i + tamanho] for i in range(0, len(pendentes), tamanho)]
+        workers = min(self.max_classificacao_workers, len(lotes))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for lote, resultado in zip(lotes, executor.map(self._classificar_lote, lotes)):
+                if resultado is None:
+                    # Falha na chamada: nada vai para o cache, o lote é tentado de novo na próxima análise
+                    continue
+                resultado_norm = {normalizar_nome(k): v for k, v in resultado.items()}
+                for ent in lote:
+                    # Entidades omitidas ou renomeadas pelo modelo ficam como "desconhecido";
+                    # sem isso seriam reenviadas à API em toda análise
+                    classif = (resultado.get(ent) or resultado_norm.get(normalizar_nome(ent))
+                               or {"tipo": "desconhecido", "local": None, "origem": "llm"})
+                    # Entidades "desconhecido" ficam menos tempo em cache: podem ser reclassificadas
+                    ttl = self.classificacao_negative_ttl if classif["tipo"] == "desconhecido" else None
+                    self._classif_cache.set(normalizar_nome(ent), classif, ttl=ttl)
+                    classif_dict[ent] = classif
+
+        print(">>> [ETAPA 1] Classificação em lote concluída.")
+        return classif_dict
+
+    def classificar_entidades(self, rotulos_por_entidade):
+        """
+        Classificação em camadas: tipagem local pelos rótulos do spaCy e pela tabela de
+        apelidos; só as entidades ambíguas seguem para classificar_em_bloco.
+        :param rotulos_por_entidade: {entidade: conjunto de rótulos spaCy das ocorrências}
+        :return: {entidade: {"tipo":..., "local":..., "origem":...}}
+        """
+        if not self.tipagem_local:
+            return self.classificar_em_bloco(list(rotulos_por_entidade))
+
+        classificacoes, ambiguas = classificar_localmente(rotulos_por_entidade, self.aliases)
+        print(f">>> [ETAPA 1] {len(classificacoes)} entidade(s) tipadas localmente, "
+              f"{len(ambiguas)} ambígua(s).")
+        if ambiguas:
+            classificacoes.update(self.classificar_em_bloco(ambiguas))
+        return classificacoes
+
+    def _classificar_lote(self, entidades):
+        """
+        Faz uma única chamada à API da OpenAI para classificar um lote de entidades.
+        Retorna None se a chamada falhar ou a resposta não for um JSON válido.
+        """
         try:
             # Prompt que enfatiza a unicidade das entidades
             prompt_str = """
@@ -53,52 +228,58 @@ class EntityClassifier:
             que cada uma apareça exatamente uma vez no array 'resultado', associada à sua respectiva categorização.
             """
 
-            prompt_entidades = "Lista de entidades:\n" + "\n".join([f"- {e}" for e in entidades_unicas])
+            prompt_entidades = "Lista de entidades:\n" + "\n".join([f"- {e}" for e in entidades])
             prompt_final = prompt_str + "\n\n" + prompt_entidades
 
-            print(">>> [ETAPA 1] classificar_entidades_em_bloco: Enviando para OpenAI GPT-4...")
+            print(f">>> [ETAPA 1] Enviando lote de {len(entidades)} entidade(s) para OpenAI GPT-4...")
             response = self.openai_client.chat.completions.create(
                 model="gpt-4",
-                messages=[{"role": "user", "content": prompt_final}]
+                messages=[{"role": "user", "content": prompt_final}],
+                timeout=self.classificacao_timeout
             )
             conteudo = response.choices[0].message.content
             print("\n--- Resposta da API (etapa 1) ---")
             print(conteudo)
 
-            data = json.loads(conteudo)
+            # Tolera texto ou cercas de código em volta do objeto JSON
+            inicio, fim = conteudo.find("{"), conteudo.rfind("}")
+            data = json.loads(conteudo[inicio:fim + 1] if inicio != -1 else conteudo)
+            tipo_map = {
+                "pessoa": "pessoa",
+                "organizacao": "organização",
+                "localizacao": "localização",
+                "desconhecido": "desconhecido"
+            }
             classif_dict = {}
             for item in data.get("resultado", []):
                 ent = item.get("entidade", "")
+                if not ent:
+                    continue
                 tipo_raw = item.get("tipo", "desconhecido")
                 loc_raw = item.get("local", None)
 
-                tipo_map = {
-                    "pessoa": "pessoa",
-                    "organizacao": "organização",
-                    "localizacao": "localização",
-                    "desconhecido": "desconhecido"
-                }
                 tipo_final = tipo_map.get(tipo_raw, "desconhecido")
                 loc_final = loc_raw if loc_raw != "null" else None
                 classif_dict[ent] = {
                     "tipo": tipo_final,
-                    "local": loc_final
+                    "local": loc_final,
+                    "origem": "llm"
                 }
-
-            print(">>> [ETAPA 1] Classificação em lote concluída.")
             return classif_dict
 
         except Exception as e:
-            print(f"Erro na classificação em bloco: {e}")
-            return {}
+            print(f"Erro na classificação do lote ({len(entidades)} entidades): {e}")
+            return None
 
     def buscar_imagem_serpapi(self, query, tipo):
         """
         Busca de imagem na SerpAPI, com cache interno e fallback para placeholder.
         """
         # Se já existe em cache, retorna diretamente
-        if query in self._image_cache:
-            return self._image_cache[query]
+        cache_key = (query, tipo)
+        cached = self._image_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
         print(f">>> [ETAPA 2] buscar_imagem_serpapi: Buscando imagem para '{query}' como '{tipo}' via SerpAPI...")
         try:
@@ -107,144 +288,285 @@ class EntityClassifier:
                 "tbm": "isch",
                 "api_key": self.serp_api_key
             }
-            response = requests.get("https://serpapi.com/search", params=params)
+            response = self._http.get("https://serpapi.com/search", params=params, timeout=self.http_timeout)
             if response.status_code == 200:
                 results = response.json()
                 if "images_results" in results and len(results["images_results"]) > 0:
                     first_thumb = results["images_results"][0]["thumbnail"]
                     print(f">>> [ETAPA 2] buscar_imagem_serpapi: Imagem encontrada para '{query}': {first_thumb}")
-                    self._image_cache[query] = first_thumb
+                    self._image_cache.set(cache_key, first_thumb)
                     return first_thumb
             print(f">>> [ETAPA 2] buscar_imagem_serpapi: Nenhuma imagem encontrada para '{query}'.")
             # Se não encontrou nada, retorna placeholder
-            self._image_cache[query] = "/static/img/placeholder.png"
-            return self._image_cache[query]
+            self._image_cache.set(cache_key, PLACEHOLDER_IMAGEM, ttl=self.image_negative_ttl)
+            return PLACEHOLDER_IMAGEM
         except Exception as e:
             print(f"Erro na SerpAPI: {e}")
-            # Em caso de exceção, retorna placeholder
-            self._image_cache[query] = "/static/img/placeholder.png"
-            return self._image_cache[query]
+            # Em caso de exceção, retorna placeholder (cache curto: o erro pode ser transitório)
+            self._image_cache.set(cache_key, PLACEHOLDER_IMAGEM, ttl=self.image_error_ttl)
+            return PLACEHOLDER_IMAGEM
+
+    def buscar_imagens_em_lote(self, pares):
+        """
+        Busca imagens para pares (entidade, tipo) únicos, em paralelo, por um pool
+        limitado de threads que compartilham a sessão HTTP.
+        Retorna um dicionário {(entidade, tipo): link_da_imagem}.
+        """
+        pares_unicos = list(dict.fromkeys(pares))
+        if not pares_unicos:
+            return {}
+        print(f">>> [ETAPA 2] buscar_imagens_em_lote: {len(pares_unicos)} busca(s) única(s)...")
+        with ThreadPoolExecutor(max_workers=min(self.max_image_workers, len(pares_unicos))) as pool:
+            links = pool.map(lambda par: self.buscar_imagem_serpapi(*par), pares_unicos)
+            return dict(zip(pares_unicos, links))
+
+def geocode_location(geolocator, query, gazetteer=None, cache=None, negative_ttl=None):
+    """
+    Tenta geocodar o texto 'query' e retorna (lat, lon) ou None.
+    Consulta, nesta ordem, o gazetteer local e o cache persistente; só recorre ao
+    Nominatim (com a pausa de rate limit) quando nenhum dos dois responde.
+    """
+    if gazetteer is not None:
+        coords = gazetteer.buscar(query)
+        if coords:
+            return coords
+
+    cache_key = normalizar_nome(query)
+    if cache is not None:
+        cached = cache.get(cache_key, PersistentCache.MISSING)
+        if cached is not PersistentCache.MISSING:
+            return tuple(cached) if cached else None
 
-def geocode_location(geolocator, query):
-    """Tenta geocodar o texto 'query' e retorna (lat, lon) ou None."""
     try:
         location = geolocator.geocode(query)
         # Aguardar um pouco para evitar limite de requisições consecutivas
         time.sleep(0.7)
-        if location:
-            return (location.latitude, location.longitude)
+        coords = (location.latitude, location.longitude) if location else None
     except (GeocoderTimedOut, GeocoderServiceError):
-        pass
-    return None
+        # Falha de rede: não entra no cache
+        return None
 
-def process_text(text, classifier):
+    if cache is not None:
+        cache.set(cache_key, list(coords) if coords else None, ttl=None if coords else negative_ttl)
+    return coords
+
+def _etapa_ner(classifier, text):
+    # Só NER e segmentação de frases; os demais componentes ficam desativados
+    doc = processar_documento(
+        classifier.nlp, text, tarefas=("entidades", "frases"),
+        batch_size=classifier.spacy_batch_size, n_process=classifier.spacy_n_process
+    )
+    print(f">>> Entidades detectadas: {[ent.text for ent in doc.ents]}")
+    return doc
+
+
+def indexar_mencoes(doc):
     """
-    Processa o texto para identificar entidades, sumarizar e gerar tópicos.
-    Também gera um mapa Folium com base nas entidades localizadas.
+    Índice de menções em uma única passada pelo Doc do spaCy.
+    :return: Dicionário com 'frases' (textos das frases, na ordem) e 'entidades':
+             {entidade: {"rotulos": set, "mencoes": [(id_frase, inicio, fim)]}},
+             com deslocamentos de caractere no texto original.
     """
-    print(">>> Iniciando processamento de texto...")
-    doc = classifier.nlp(text)
-    entidades = [ent.text for ent in doc.ents]
-    print(f">>> Entidades detectadas: {entidades}")
+    if doc.has_annotation("SENT_START"):
+        sentencas = list(doc.sents)
+    else:
+        sentencas = [doc[:]]
+    inicios = np.fromiter((s.start for s in sentencas), dtype=np.int64, count=len(sentencas))
+
+    entidades = {}
+    for ent in doc.ents:
+        id_frase = int(np.searchsorted(inicios, ent.start, side="right")) - 1
+        info = entidades.setdefault(ent.text, {"rotulos": set(), "mencoes": []})
+        info["rotulos"].add(ent.label_)
+        info["mencoes"].append((id_frase, ent.start_char, ent.end_char))
+    return {"frases": [s.text for s in sentencas], "entidades": entidades}
+
+
+def _etapa_base_conhecimento(classifier, indice):
+    # Entidades já conhecidas de análises anteriores (qualquer projeto), pelo nome
+    # canônico ou por qualquer uma das grafias agrupadas sob ele
+    grafias = {ent: [ent, *info.get("aliases", [])] for ent, info in indice["entidades"].items()}
+    encontradas = classifier.base_conhecimento.buscar_muitos([g for gs in grafias.values() for g in gs])
+    conhecidas = {}
+    for ent, gs in grafias.items():
+        registro = next((encontradas[g] for g in gs if g in encontradas), None)
+        if registro is not None:
+            conhecidas[ent] = registro
+    print(f">>> [BASE] {len(conhecidas)} de {len(indice['entidades'])} entidade(s) já conhecidas.")
+    return conhecidas
 
-    # Classificação em lote
-    entidades_unicas = list(set(entidades))
-    classificacoes = classifier.classificar_em_bloco(entidades_unicas)
+
+def _etapa_classificacao(classifier, indice, conhecidas):
+    """
+    Classifica cada entidade única do índice de menções, com a contagem de ocorrências
+    e a origem do tipo ("llm", "apelidos" ou "spacy").
+    Entidades cujo tipo na base de conhecimento veio do LLM ou da tabela de apelidos
+    não são reclassificadas; tipos deduzidos do spaCy passam de novo pelas camadas.
+    """
+    classificacoes = {
+        ent: {"tipo": reg["tipo"], "local": reg["local"], "origem": reg["origem_tipo"]}
+        for ent, reg in conhecidas.items() if reg["tipo"] and reg["origem_tipo"] in ORIGENS_CONFIAVEIS
+    }
+    rotulos_por_entidade = {ent: info["rotulos"] for ent, info in indice["entidades"].items()
+                            if ent not in classificacoes}
+    # Classificação em camadas: rótulos do spaCy e apelidos locais, LLM só para as ambíguas
+    if rotulos_por_entidade:
+        classificacoes.update(classifier.classificar_entidades(rotulos_por_entidade))
+
+    # Variantes de grafia (caixa, acentos) compartilham a mesma classificação
+    classificacoes_norm = {normalizar_nome(k): v for k, v in classificacoes.items()}
 
     entidades_classificadas = []
-    for ent in entidades:
-        if ent in classificacoes:
-            etype = classificacoes[ent]["tipo"]
-            elocal = classificacoes[ent]["local"]
-            entidades_classificadas.append({"entidade": ent, "tipo": etype, "local": elocal})
-        else:
-            entidades_classificadas.append({"entidade": ent, "tipo": "desconhecido", "local": None})
+    for ent, info in indice["entidades"].items():
+        classif = classificacoes.get(ent) or classificacoes_norm.get(normalizar_nome(ent))
+        entidades_classificadas.append({
+            "entidade": ent,
+            "tipo": classif["tipo"] if classif else "desconhecido",
+            "local": classif["local"] if classif else None,
+            "origem": classif.get("origem") if classif else None,
+            "ocorrencias": len(info["mencoes"]),
+            "aliases": info.get("aliases", [])
+        })
+    return entidades_classificadas
+
 
-    # Separar entidades em pessoas/organizações e localizações
+def _etapa_sentimento(classifier, indice, entidades_classificadas):
+    """
+    Separa pessoas/organizações e localizações, anexando a cada uma o sentimento médio
+    das frases que a mencionam. Cada frase é pontuada uma única vez.
+    """
     pessoas_organizacoes = [e for e in entidades_classificadas if e["tipo"] in ["pessoa", "organização"]]
     localizacoes = [e for e in entidades_classificadas if e["tipo"] == "localização"]
 
-    # Análise de sentimento
-    pessoas_organizacoes_com_sentimento = []
-    for entidade_info in pessoas_organizacoes:
-        sentimento = classifier.sia.polarity_scores(entidade_info["entidade"])
-        pessoas_organizacoes_com_sentimento.append({
-            **entidade_info,
-            "sentimento": sentimento['compound']
-        })
+    frases_por_entidade = {
+        e["entidade"]: sorted({m[0] for m in indice["entidades"][e["entidade"]]["mencoes"]})
+        for e in pessoas_organizacoes + localizacoes
+    }
+    ids_frases = sorted(set().union(*frases_por_entidade.values()))
+    sia = classifier.sia
+    escores = {i: sia.polarity_scores(indice["frases"][i])["compound"] for i in ids_frases}
 
-    localizacoes_com_sentimento = []
-    for entidade_info in localizacoes:
-        sentimento = classifier.sia.polarity_scores(entidade_info["entidade"])
-        localizacoes_com_sentimento.append({
-            **entidade_info,
-            "sentimento": sentimento['compound']
-        })
+    def com_sentimento(entidades):
+        return [
+            {**e, "sentimento": float(np.mean([escores[i] for i in frases_por_entidade[e["entidade"]]]))}
+            for e in entidades
+        ]
+
+    return com_sentimento(pessoas_organizacoes), com_sentimento(localizacoes)
+
+
+def _resumir_texto(text, modo, em_processo):
+    """
+    Resumo extrativo (com cache). Com em_processo, o BERT roda no worker do pool de
+    processos, onde o modelo é carregado uma única vez.
+    """
+    return resumir(text, modo=modo, em_processo=em_processo)
 
-    # Geração de resumo com BERT
-    resumo = classifier.bert_model(text)
 
-    # Clustering de tópicos
-    frases = [sent.text for sent in doc.sents]
+def _etapa_topicos(doc):
+    # Clustering de tópicos: frase mais próxima do centroide de cada tópico
+    frases = [sent.text for sent in doc.sents if sent.text.strip()]
     if len(frases) > 1:
-        vectorizer = TfidfVectorizer(max_features=100, stop_words='english')
-        X = vectorizer.fit_transform(frases)
-        num_clusters = min(3, len(frases))
-        kmeans = KMeans(n_clusters=num_clusters, random_state=42)
-        kmeans.fit(X)
-        clusters = kmeans.labels_
-
-        topicos = {}
-        for i, c in enumerate(clusters):
-            if c not in topicos:
-                topicos[c] = []
-            topicos[c].append(frases[i])
-
-        topicos_principais = []
-        for c in topicos:
-            centroide = np.mean(X[clusters == c], axis=0)
-            indice_representante = np.argmin(
-                np.linalg.norm(X[clusters == c] - centroide, axis=1)
-            )
-            topicos_principais.append(topicos[c][indice_representante])
-    else:
-        topicos_principais = ["Não há frases suficientes para clustering."]
-
-    # Busca de imagens para cada entidade
-    pessoas_organizacoes_com_imagens = []
-    for entidade_info in pessoas_organizacoes_com_sentimento:
-        image_link = classifier.buscar_imagem_serpapi(entidade_info["entidade"], entidade_info["tipo"])
-        pessoas_organizacoes_com_imagens.append({**entidade_info, "imagem": image_link})
-
-    localizacoes_com_imagens = []
-    for entidade_info in localizacoes_com_sentimento:
-        image_link = classifier.buscar_imagem_serpapi(entidade_info["entidade"], "localização")
-        localizacoes_com_imagens.append({**entidade_info, "imagem": image_link})
-
-    # >>> Construir mapa dinamicamente via Folium <<<
-    # Posição inicial "genérica" centrada no Brasil
-    mapa = folium.Map(location=[-15.0, -50.0], zoom_start=4)
-    # Para cada local, tentar geocodar e adicionar marker
-    for loc in localizacoes_com_imagens:
-        coords = geocode_location(classifier.geolocator, loc["entidade"])
-        if coords:
-            popup_str = (f"Entidade: {loc['entidade']}<br>"
-                         f"Tipo: {loc['tipo']}<br>"
-                         f"Local Esperado: {loc['local']}<br>"
-                         f"Sentimento: {loc['sentimento']:.2f}")
-            folium.Marker(
-                location=coords,
-                popup=popup_str,
-                tooltip=f"{loc['entidade']} - {loc['tipo']}"
-            ).add_to(mapa)
-
-    # Gera HTML do mapa para embutir no front-end
-    map_html = mapa._repr_html_()
+        return extrair_topicos(frases)["representantes"]
+    return ["Não há frases suficientes para clustering."]
+
+
+def _etapa_imagens(classifier, conhecidas, sentimentos):
+    pessoas_organizacoes_com_sentimento, localizacoes_com_sentimento = sentimentos
+    pares = ([(e["entidade"], e["tipo"]) for e in pessoas_organizacoes_com_sentimento] +
+             [(e["entidade"], "localização") for e in localizacoes_com_sentimento])
+    # Imagens já registradas na base de conhecimento dispensam a busca
+    imagens = {par: conhecidas[par[0]]["imagem"] for par in pares
+               if par[0] in conhecidas and conhecidas[par[0]]["imagem"]}
+    # Busca de imagens: uma por (entidade, tipo) único, em paralelo
+    imagens.update(classifier.buscar_imagens_em_lote([par for par in pares if par not in imagens]))
+    pessoas_organizacoes_com_imagens = [
+        {**entidade_info, "imagem": imagens[(entidade_info["entidade"], entidade_info["tipo"])]}
+        for entidade_info in pessoas_organizacoes_com_sentimento
+    ]
+    localizacoes_com_imagens = [
+        {**entidade_info, "imagem": imagens[(entidade_info["entidade"], "localização")]}
+        for entidade_info in localizacoes_com_sentimento
+    ]
+    return pessoas_organizacoes_com_imagens, localizacoes_com_imagens
+
+
+def _etapa_geocodificacao(classifier, conhecidas, sentimentos):
+    # Geocodifica cada nome uma única vez; coordenadas da base de conhecimento primeiro
+    _, localizacoes_com_sentimento = sentimentos
+    return {
+        nome: (conhecidas[nome]["coordenadas"] if nome in conhecidas and conhecidas[nome]["coordenadas"]
+               else geocode_location(
+                   classifier.geolocator, nome,
+                   gazetteer=classifier.gazetteer,
+                   cache=classifier._geocode_cache,
+                   negative_ttl=classifier.geocode_negative_ttl
+               ))
+        for nome in dict.fromkeys(loc["entidade"] for loc in localizacoes_com_sentimento)
+    }
+
+
+def _etapa_enriquecer_base(classifier, imagens, coordenadas):
+    """
+    Registra na base de conhecimento o que esta análise aprendeu sobre cada entidade.
+    """
+    pessoas_organizacoes, localizacoes = imagens
+    classifier.base_conhecimento.registrar([
+        {
+            "entidade": e["entidade"],
+            "tipo": e["tipo"],
+            "origem_tipo": e.get("origem"),
+            "local": e["local"],
+            "imagem": e["imagem"] if e["imagem"] != PLACEHOLDER_IMAGEM else None,
+            "coordenadas": coordenadas.get(e["entidade"]),
+            "ocorrencias": e["ocorrencias"],
+            "aliases": e.get("aliases", [])
+        }
+        for e in pessoas_organizacoes + localizacoes
+    ])
+
+
+def _etapa_geojson(imagens, coordenadas):
+    # GeoJSON compacto das localizações geocodificadas; o navegador desenha o mapa
+    _, localizacoes_com_imagens = imagens
+    return feature_collection(localizacoes_com_imagens, coordenadas)
+
+
+def process_text(text, classifier):
+    """
+    Processa o texto para identificar entidades, sumarizar e gerar tópicos.
+    As entidades localizadas vêm em 'geojson' (FeatureCollection de pontos).
+    Variantes de uma mesma entidade ("Lula", "Lula da Silva") são agrupadas sob a forma
+    canônica; cada entidade aparece uma única vez, com as demais grafias ('aliases'),
+    o número de ocorrências ('ocorrencias') e o sentimento médio das frases que a mencionam.
+    As etapas independentes rodam em paralelo (o resumo BERT em processo separado,
+    se classifier.resumo_em_processo; o modo do resumo vem de classifier.resumo_modo);
+    os tempos por etapa ficam em classifier.ultimos_tempos.
+    """
+    print(">>> Iniciando processamento de texto...")
+    etapas = [
+        Etapa("ner", _etapa_ner, args=(classifier, text)),
+        Etapa("mencoes", indexar_mencoes, ["ner"]),
+        Etapa("aliases", resolver_aliases, ["mencoes"]),
+        Etapa("base_conhecimento", _etapa_base_conhecimento, ["aliases"], args=(classifier,)),
+        Etapa("classificacao", _etapa_classificacao, ["aliases", "base_conhecimento"], args=(classifier,)),
+        Etapa("sentimento", _etapa_sentimento, ["aliases", "classificacao"], args=(classifier,)),
+        Etapa("resumo", _resumir_texto, args=(text, classifier.resumo_modo, classifier.resumo_em_processo)),
+        Etapa("topicos", _etapa_topicos, ["ner"]),
+        Etapa("imagens", _etapa_imagens, ["base_conhecimento", "sentimento"], args=(classifier,)),
+        Etapa("geocodificacao", _etapa_geocodificacao, ["base_conhecimento", "sentimento"], args=(classifier,)),
+        Etapa("enriquecer_base", _etapa_enriquecer_base, ["imagens", "geocodificacao"], args=(classifier,)),
+        Etapa("geojson", _etapa_geojson, ["imagens", "geocodificacao"]),
+    ]
+    executor = StageExecutor(etapas)
+    resultados = executor.executar()
+    classifier.ultimos_tempos = executor.tempos
 
+    pessoas_organizacoes_com_imagens, localizacoes_com_imagens = resultados["imagens"]
     return {
         "pessoas": pessoas_organizacoes_com_imagens,
         "localizacoes": localizacoes_com_imagens,
-        "resumo": resumo,
-        "topicos": topicos_principais,
-        "map_html": map_html  # HTML do mapa gerado
+        "resumo": resultados["resumo"],
+        "topicos": resultados["topicos"],
+        "geojson": resultados["geojson"]  # pontos para o mapa no front-end
     }
@@ -0,0 +1,120 @@
+import os
+import sys
+import csv
+import sqlite3
+import threading
+import unicodedata
+import re
+
+# Índice local de topônimos (extrato GeoNames), consultado antes de qualquer geocodificação em rede.
+# Gere com: python -m modules.gazetteer BR.txt  (dump de https://download.geonames.org/export/dump/)
+DEFAULT_GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", "./static/cache/gazetteer_br.sqlite")
+
+# Classes de feição do GeoNames importadas por padrão: A (divisões administrativas) e P (localidades)
+CLASSES_PADRAO = ("A", "P")
+
+_ESPACOS_RE = re.compile(r"\s+")
+
+
+def normalizar_nome(nome):
+    """
+    Normaliza um topônimo para busca: sem acentos, minúsculo e com espaços simples.
+    """
+    nome = unicodedata.normalize("NFKD", nome)
+    nome = "".join(c for c in nome if not unicodedata.combining(c))
+    return _ESPACOS_RE.sub(" ", nome).strip().lower()
+
+
+class Gazetteer:
+    """
+    Consulta somente leitura ao índice SQLite de topônimos, por nome normalizado.
+    Se o arquivo não existir, o gazetteer fica desativado e 'buscar' retorna None.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path or DEFAULT_GAZETTEER_PATH
+        self.disponivel = os.path.isfile(self.db_path)
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{os.path.abspath(self.db_path)}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def buscar(self, nome):
+        """
+        Retorna (lat, lon) do lugar mais populoso com esse nome (ou nome alternativo),
+        ou None se não houver correspondência.
+        """
+        if not self.disponivel or not nome:
+            return None
+        row = self._conn().execute("""
+            SELECT l.latitude, l.longitude
+            FROM nomes n JOIN lugares l ON l.geonameid = n.geonameid
+            WHERE n.nome_normalizado = ?
+            ORDER BY l.populacao DESC
+            LIMIT 1
+        """, (normalizar_nome(nome),)).fetchone()
+        return (row[0], row[1]) if row else None
+
+
+def importar_geonames(caminho_dump, db_path=None, classes=CLASSES_PADRAO):
+    """
+    Importa um dump do GeoNames (formato TSV, por exemplo BR.txt) para o índice SQLite,
+    indexando o nome, o nome ASCII e os nomes alternativos de cada lugar.
+    :return: Quantidade de lugares importados.
+    """
+    db_path = db_path or DEFAULT_GAZETTEER_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lugares (
+            geonameid INTEGER PRIMARY KEY,
+            nome TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            classe TEXT,
+            codigo TEXT,
+            populacao INTEGER
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS nomes (
+            nome_normalizado TEXT NOT NULL,
+            geonameid INTEGER NOT NULL,
+            PRIMARY KEY (nome_normalizado, geonameid)
+        ) WITHOUT ROWID
+    """)
+
+    total = 0
+    csv.field_size_limit(sys.maxsize)
+    with open(caminho_dump, encoding="utf-8", newline="") as f:
+        for campos in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if len(campos) < 15 or campos[6] not in classes:
+                continue
+            geonameid = int(campos[0])
+            cursor.execute(
+                "INSERT OR REPLACE INTO lugares VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (geonameid, campos[1], float(campos[4]), float(campos[5]),
+                 campos[6], campos[7], int(campos[14] or 0))
+            )
+            variantes = {campos[1], campos[2], *campos[3].split(",")}
+            cursor.executemany(
+                "INSERT OR IGNORE INTO nomes VALUES (?, ?)",
+                [(normalizar_nome(v), geonameid) for v in variantes if v.strip()]
+            )
+            total += 1
+
+    conn.commit()
+    conn.close()
+    return total
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python -m modules.gazetteer <dump_geonames.txt> [destino.sqlite]")
+        sys.exit(1)
+    destino = sys.argv[2] if len(sys.argv) > 2 else None
+    print(f"Lugares importados: {importar_geonames(sys.argv[1], destino)}")
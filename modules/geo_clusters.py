@@ -0,0 +1,109 @@
+import numpy as np
+
+# Acima dessa quantidade de pontos, a resposta sem zoom explícito já vem agrupada
+LIMIAR_AGRUPAMENTO = 200
+
+# Zoom inicial do mapa (visão do Brasil inteiro)
+ZOOM_PADRAO = 4
+
+# Quantas células da grade cabem na largura de um "tile" do mapa no zoom pedido
+CELULAS_POR_TILE = 4
+
+# Nomes listados nas propriedades de um cluster
+MAX_NOMES_CLUSTER = 10
+
+
+def feature_collection(localizacoes, coordenadas):
+    """
+    GeoJSON (FeatureCollection) das localizações que foram geocodificadas.
+    :param localizacoes: Entidades do tipo localização (com sentimento, ocorrências, imagem...).
+    :param coordenadas: {entidade: (lat, lon) ou None}
+    """
+    features = []
+    for loc in localizacoes:
+        coords = coordenadas.get(loc["entidade"])
+        if not coords:
+            continue
+        lat, lon = coords
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(lon, 5), round(lat, 5)]},
+            "properties": {
+                "entidade": loc["entidade"],
+                "tipo": loc["tipo"],
+                "local": loc.get("local"),
+                "ocorrencias": loc.get("ocorrencias", 1),
+                "sentimento": round(loc.get("sentimento", 0.0), 3),
+                "imagem": loc.get("imagem")
+            }
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def tamanho_celula(zoom):
+    """
+    Largura (em graus) da célula da grade para o zoom do mapa (escala Web Mercator).
+    """
+    return 360.0 / (2 ** max(0, int(zoom))) / CELULAS_POR_TILE
+
+
+def agrupar_features(colecao, zoom=ZOOM_PADRAO, bbox=None):
+    """
+    Agrupa pontos próximos numa grade regular cujo tamanho depende do zoom.
+    Células com um único ponto mantêm a feature original; as demais viram um ponto
+    no centroide, com 'cluster': True, a 'quantidade' de entidades, o total de
+    ocorrências, o sentimento médio ponderado e os nomes mais citados.
+    :param colecao: FeatureCollection retornada por feature_collection.
+    :param bbox: Opcional (oeste, sul, leste, norte); pontos fora dele são descartados.
+    :return: Nova FeatureCollection.
+    """
+    features = colecao.get("features", [])
+    if not features:
+        return {"type": "FeatureCollection", "features": []}
+
+    coords = np.array([f["geometry"]["coordinates"] for f in features], dtype=np.float64)
+    if bbox is not None:
+        oeste, sul, leste, norte = bbox
+        dentro = ((coords[:, 0] >= oeste) & (coords[:, 0] <= leste) &
+                  (coords[:, 1] >= sul) & (coords[:, 1] <= norte))
+        features = [f for f, ok in zip(features, dentro) if ok]
+        coords = coords[dentro]
+        if not features:
+            return {"type": "FeatureCollection", "features": []}
+
+    celula = tamanho_celula(zoom)
+    chaves = np.floor(coords / celula).astype(np.int64)
+    _, grupo = np.unique(chaves, axis=0, return_inverse=True)
+    grupo = grupo.ravel()
+    ocorrencias = np.array([f["properties"].get("ocorrencias", 1) for f in features], dtype=np.float64)
+    sentimentos = np.array([f["properties"].get("sentimento", 0.0) for f in features], dtype=np.float64)
+
+    n_grupos = grupo.max() + 1
+    tamanhos = np.bincount(grupo, minlength=n_grupos)
+    peso = np.bincount(grupo, weights=ocorrencias, minlength=n_grupos)
+    lon = np.bincount(grupo, weights=coords[:, 0] * ocorrencias, minlength=n_grupos) / peso
+    lat = np.bincount(grupo, weights=coords[:, 1] * ocorrencias, minlength=n_grupos) / peso
+    sentimento = np.bincount(grupo, weights=sentimentos * ocorrencias, minlength=n_grupos) / peso
+
+    membros = {}
+    for i, g in enumerate(grupo):
+        membros.setdefault(int(g), []).append(i)
+
+    saida = []
+    for g, indices in membros.items():
+        if tamanhos[g] == 1:
+            saida.append(features[indices[0]])
+            continue
+        indices.sort(key=lambda i: -ocorrencias[i])
+        saida.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(lon[g], 5), round(lat[g], 5)]},
+            "properties": {
+                "cluster": True,
+                "quantidade": int(tamanhos[g]),
+                "ocorrencias": int(peso[g]),
+                "sentimento": round(float(sentimento[g]), 3),
+                "entidades": [features[i]["properties"]["entidade"] for i in indices[:MAX_NOMES_CLUSTER]]
+            }
+        })
+    return {"type": "FeatureCollection", "features": saida}
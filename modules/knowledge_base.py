@@ -0,0 +1,209 @@
+import os
+import sqlite3
+import time
+from modules.gazetteer import normalizar_nome
+from modules.persistent_cache import ativar_wal, LOTE_CONSULTA
+
+# Base de conhecimento de entidades compartilhada por todos os DBs de projeto.
+# Fica fora de static/dbs para não aparecer na lista de DBs.
+DEFAULT_KB_PATH = os.getenv("ENTITY_KB_PATH", "./static/cache/entidades.sqlite")
+
+# Origens de tipo confiáveis (LLM e tabela de apelidos). Tipos deduzidos dos rótulos do
+# spaCy ("spacy") são guardados, mas não dispensam a classificação em análises futuras.
+ORIGENS_CONFIAVEIS = ("llm", "apelidos")
+
+_COLUNAS = ("id", "nome_canonico", "tipo", "origem_tipo", "local", "latitude", "longitude",
+            "imagem", "primeira_vez", "ultima_vez", "ocorrencias")
+
+
+class EntityKnowledgeBase:
+    """
+    Entidades já vistas em qualquer análise: nome canônico, apelidos, tipo, coordenadas,
+    imagem e datas da primeira/última aparição, indexadas pelo nome normalizado.
+    As análises consultam a base antes de classificar, buscar imagens e geocodificar,
+    e a enriquecem ao final.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path or DEFAULT_KB_PATH
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            ativar_wal(conn)
+            # Criação e migração numa transação de escrita: processos concorrentes esperam
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entidades (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nome_canonico TEXT NOT NULL,
+                    tipo TEXT,
+                    origem_tipo TEXT,
+                    local TEXT,
+                    latitude REAL,
+                    longitude REAL,
+                    imagem TEXT,
+                    primeira_vez TEXT NOT NULL,
+                    ultima_vez TEXT NOT NULL,
+                    ocorrencias INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS aliases (
+                    alias_normalizado TEXT NOT NULL PRIMARY KEY,
+                    entidade_id INTEGER NOT NULL,
+                    alias TEXT NOT NULL
+                ) WITHOUT ROWID
+            """)
+            self._migrar(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _migrar(conn):
+        """
+        Atualiza bases criadas antes da coluna origem_tipo e do apelido único.
+        """
+        colunas = {row[1] for row in conn.execute("PRAGMA table_info(entidades)")}
+        if "origem_tipo" not in colunas:
+            # Tipos antigos não têm origem conhecida: serão confirmados na próxima análise
+            conn.execute("ALTER TABLE entidades ADD COLUMN origem_tipo TEXT")
+        # Base antiga: chave (apelido, entidade). Mantém cada apelido na entidade mais citada
+        # e cria o índice único que o ON CONFLICT de registrar usa.
+        chave = [row[1] for row in conn.execute("PRAGMA table_info(aliases)") if row[5]]
+        indice = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_aliases_alias'"
+        ).fetchone()
+        if chave != ["alias_normalizado"] and not indice:
+            conn.execute("""
+                DELETE FROM aliases WHERE entidade_id != (
+                    SELECT a2.entidade_id FROM aliases a2 JOIN entidades e ON e.id = a2.entidade_id
+                    WHERE a2.alias_normalizado = aliases.alias_normalizado
+                    ORDER BY e.ocorrencias DESC, e.id ASC LIMIT 1
+                )
+            """)
+            conn.execute("CREATE UNIQUE INDEX idx_aliases_alias ON aliases(alias_normalizado)")
+
+    @staticmethod
+    def _registro(row):
+        registro = dict(zip(_COLUNAS, row))
+        lat, lon = registro.pop("latitude"), registro.pop("longitude")
+        registro["coordenadas"] = (lat, lon) if lat is not None and lon is not None else None
+        return registro
+
+    def _buscar_normalizados(self, conn, normalizados):
+        """
+        {nome_normalizado: registro} para os nomes (ou apelidos) conhecidos.
+        """
+        encontrados = {}
+        colunas = ", ".join(f"e.{c}" for c in _COLUNAS)
+        for i in range(0, len(normalizados), LOTE_CONSULTA):
+            lote = normalizados[i:i + LOTE_CONSULTA]
+            rows = conn.execute(f"""
+                SELECT a.alias_normalizado, {colunas}
+                FROM aliases a JOIN entidades e ON e.id = a.entidade_id
+                WHERE a.alias_normalizado IN ({", ".join("?" * len(lote))})
+            """, lote).fetchall()
+            for row in rows:
+                encontrados[row[0]] = self._registro(row[1:])
+        return encontrados
+
+    def buscar_muitos(self, nomes):
+        """
+        Consulta em lote por nome ou apelido.
+        :return: {nome: registro} só para os nomes conhecidos; registro tem id, nome_canonico,
+                 tipo, origem_tipo, local, coordenadas (lat, lon) ou None, imagem,
+                 primeira_vez, ultima_vez e ocorrencias.
+        """
+        por_normalizado = {}
+        for nome in nomes:
+            chave = normalizar_nome(nome)
+            if chave:
+                por_normalizado.setdefault(chave, []).append(nome)
+        if not por_normalizado:
+            return {}
+        conn = self._connect()
+        try:
+            encontrados = self._buscar_normalizados(conn, list(por_normalizado))
+        finally:
+            conn.close()
+        return {nome: registro
+                for chave, registro in encontrados.items()
+                for nome in por_normalizado[chave]}
+
+    def buscar(self, nome):
+        return self.buscar_muitos([nome]).get(nome)
+
+    def registrar(self, entidades):
+        """
+        Insere ou enriquece entidades, numa única transação de escrita (processos
+        concorrentes não criam a mesma entidade duas vezes).
+        Campos nulos não apagam o que já se sabe (passe imagem=None para placeholders);
+        um tipo de origem confiável não é substituído por um deduzido do spaCy.
+        :param entidades: Lista de dicts com 'entidade' e, opcionalmente, 'tipo', 'origem_tipo'
+                          ("llm", "apelidos" ou "spacy"), 'local', 'coordenadas' (lat, lon),
+                          'imagem', 'ocorrencias' e 'aliases'.
+        """
+        if not entidades:
+            return
+        agora = time.strftime('%Y%m%d_%H%M%S')
+        confiaveis = ", ".join(f"'{o}'" for o in ORIGENS_CONFIAVEIS)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.cursor()
+            conhecidos = self._buscar_normalizados(
+                conn, list({normalizar_nome(e["entidade"]) for e in entidades})
+            )
+            for e in entidades:
+                chave = normalizar_nome(e["entidade"])
+                if not chave:
+                    continue
+                coords = e.get("coordenadas") or (None, None)
+                tipo = e.get("tipo") if e.get("tipo") != "desconhecido" else None
+                origem = e.get("origem_tipo") if tipo else None
+                registro = conhecidos.get(chave)
+                if registro is None:
+                    cursor.execute("""
+                        INSERT INTO entidades
+                        (nome_canonico, tipo, origem_tipo, local, latitude, longitude, imagem,
+                         primeira_vez, ultima_vez, ocorrencias)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (e["entidade"], tipo, origem, e.get("local"), coords[0], coords[1],
+                          e.get("imagem"), agora, agora, e.get("ocorrencias", 1)))
+                    entidade_id = cursor.lastrowid
+                    conhecidos[chave] = {"id": entidade_id}
+                else:
+                    entidade_id = registro["id"]
+                    cursor.execute(f"""
+                        UPDATE entidades SET
+                            tipo = CASE WHEN :tipo IS NOT NULL AND (:origem IN ({confiaveis})
+                                        OR origem_tipo IS NULL OR origem_tipo NOT IN ({confiaveis}))
+                                   THEN :tipo ELSE tipo END,
+                            origem_tipo = CASE WHEN :tipo IS NOT NULL AND (:origem IN ({confiaveis})
+                                               OR origem_tipo IS NULL OR origem_tipo NOT IN ({confiaveis}))
+                                          THEN :origem ELSE origem_tipo END,
+                            local = COALESCE(:local, local),
+                            latitude = COALESCE(:lat, latitude),
+                            longitude = COALESCE(:lon, longitude),
+                            imagem = COALESCE(:imagem, imagem),
+                            ultima_vez = :agora,
+                            ocorrencias = ocorrencias + :ocorrencias
+                        WHERE id = :id
+                    """, {"tipo": tipo, "origem": origem, "local": e.get("local"), "lat": coords[0],
+                          "lon": coords[1], "imagem": e.get("imagem"), "agora": agora,
+                          "ocorrencias": e.get("ocorrencias", 1), "id": entidade_id})
+                apelidos = {e["entidade"], *e.get("aliases", ())}
+                # Cada apelido pertence a uma única entidade: a primeira que o registrou
+                cursor.executemany("""
+                    INSERT INTO aliases (alias_normalizado, entidade_id, alias) VALUES (?, ?, ?)
+                    ON CONFLICT(alias_normalizado) DO NOTHING
+                """, [(normalizar_nome(a), entidade_id, a) for a in apelidos if normalizar_nome(a)])
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,138 @@
+import gc
+import os
+import threading
+import time
+
+
+def _rss_bytes():
+    """
+    Retorna a memória residente (RSS) do processo em bytes, ou None se indisponível.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _bytes_parametros(modelo):
+    """
+    Soma o tamanho dos parâmetros de modelos PyTorch (quando o objeto os expõe).
+    """
+    for candidato in (modelo, getattr(modelo, "model", None)):
+        parametros = getattr(candidato, "parameters", None)
+        if callable(parametros):
+            try:
+                return sum(p.numel() * p.element_size() for p in parametros())
+            except Exception:
+                return None
+    return None
+
+
+class ModelRegistry:
+    """
+    Registro de modelos pesados compartilhados pelo processo inteiro.
+    Cada modelo é carregado uma única vez, sob demanda, e devolvido como
+    instância compartilhada; pode ser descarregado explicitamente.
+    """
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._info = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        """
+        Registra a função (sem argumentos) que carrega o modelo 'name'.
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        """
+        Retorna a instância compartilhada do modelo, carregando-a na primeira chamada.
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self._loaders:
+            raise KeyError(f"Modelo não registrado: {name}")
+
+        # Lock por modelo: carregar o BERT não bloqueia quem só precisa do spaCy
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is not None:
+                return model
+            print(f">>> [MODELOS] Carregando '{name}'...")
+            rss_antes = _rss_bytes()
+            inicio = time.time()
+            model = self._loaders[name]()
+            rss_depois = _rss_bytes()
+            self._info[name] = {
+                "tempo_carga_s": round(time.time() - inicio, 3),
+                "rss_delta_bytes": (rss_depois - rss_antes) if rss_antes and rss_depois else None,
+                "parametros_bytes": _bytes_parametros(model),
+                "carregado_em": time.strftime('%Y%m%d_%H%M%S')
+            }
+            self._models[name] = model
+            print(f">>> [MODELOS] '{name}' carregado em {self._info[name]['tempo_carga_s']}s.")
+            return model
+
+    def unload(self, name):
+        """
+        Descarrega o modelo, liberando a referência compartilhada.
+        Retorna True se havia um modelo carregado.
+        """
+        with self._locks.get(name, self._lock):
+            model = self._models.pop(name, None)
+            self._info.pop(name, None)
+        if model is None:
+            return False
+        del model
+        gc.collect()
+        return True
+
+    def memory_report(self):
+        """
+        Relatório por modelo registrado: se está carregado, tempo de carga e memória.
+        """
+        return {
+            name: {"carregado": name in self._models, **self._info.get(name, {})}
+            for name in self._loaders
+        }
+
+
+def _load_spacy():
+    import spacy
+    return spacy.load("pt_core_news_sm")
+
+
+def _load_summarizer():
+    from summarizer import Summarizer
+    return Summarizer()
+
+
+def _load_sentence_encoder():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer('paraphrase-MiniLM-L6-v2')
+
+
+def _load_vader():
+    from nltk.sentiment import SentimentIntensityAnalyzer
+    return SentimentIntensityAnalyzer()
+
+
+registry = ModelRegistry()
+registry.register("spacy", _load_spacy)
+registry.register("summarizer", _load_summarizer)
+registry.register("sentence_encoder", _load_sentence_encoder)
+registry.register("vader", _load_vader)
+
+
+def get_model(name):
+    """
+    Atalho para registry.get(name).
+    """
+    return registry.get(name)
@@ -0,0 +1,173 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+# Arquivo SQLite compartilhado pelos caches de consultas externas (imagens, geocodificação, ...).
+# Fica fora de static/dbs para não aparecer na lista de DBs de projeto.
+DEFAULT_CACHE_PATH = os.getenv("LOOKUP_CACHE_PATH", "./static/cache/lookups.sqlite")
+
+# Limite de parâmetros por consulta IN (o SQLite aceita até 999 em versões antigas)
+LOTE_CONSULTA = 500
+
+
+def ativar_wal(conn, tentativas=20):
+    """
+    Coloca o arquivo SQLite em modo WAL (o modo fica gravado no arquivo).
+    A troca de modo não respeita o timeout de espera do SQLite, então tenta algumas
+    vezes quando vários processos criam o arquivo ao mesmo tempo.
+    """
+    for tentativa in range(tentativas):
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            return
+        except sqlite3.OperationalError:
+            time.sleep(0.05 * (tentativa + 1))
+
+
+class PersistentCache:
+    """
+    Cache chave -> valor com TTL, persistido em SQLite e com uma camada em memória
+    à frente. O arquivo pode ser compartilhado por vários processos (modo WAL);
+    cada namespace separa um tipo de consulta dentro do mesmo arquivo.
+    Chaves podem ser strings ou tuplas; valores devem ser serializáveis em JSON.
+    """
+    MISSING = object()
+
+    def __init__(self, namespace, db_path=None, ttl=30 * 24 * 3600, memory_size=2048):
+        self.namespace = namespace
+        self.db_path = db_path or DEFAULT_CACHE_PATH
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._init_db()
+        # Limpa as entradas vencidas ao abrir o cache, para que não se acumulem no arquivo
+        self.purge_expired()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            ativar_wal(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    chave TEXT NOT NULL,
+                    valor TEXT,
+                    expira_em REAL NOT NULL,
+                    PRIMARY KEY (namespace, chave)
+                )
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(key, ensure_ascii=False) if isinstance(key, (tuple, list)) else str(key)
+
+    def _remember(self, chave, valor, expira_em):
+        with self._lock:
+            if len(self._memory) >= self.memory_size:
+                self._memory.pop(next(iter(self._memory)))
+            self._memory[chave] = (valor, expira_em)
+
+    def get(self, key, default=None):
+        """
+        Retorna o valor em cache (memória, depois SQLite) ou 'default' se ausente/expirado.
+        """
+        chave = self._key(key)
+        agora = time.time()
+        item = self._memory.get(chave)
+        if item is not None and item[1] > agora:
+            return item[0]
+
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT valor, expira_em FROM cache WHERE namespace = ? AND chave = ?",
+                (self.namespace, chave)
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row or row[1] <= agora:
+            return default
+        valor = json.loads(row[0])
+        self._remember(chave, valor, row[1])
+        return valor
+
+    def get_many(self, keys, default=None):
+        """
+        Versão em lote de get: retorna {key: valor} para todas as chaves pedidas.
+        As chaves fora da memória são buscadas no SQLite em consultas IN de até
+        LOTE_CONSULTA chaves.
+        """
+        agora = time.time()
+        chaves = {key: self._key(key) for key in keys}
+        valores = {}
+        faltando = []
+        for chave in dict.fromkeys(chaves.values()):
+            item = self._memory.get(chave)
+            if item is not None and item[1] > agora:
+                valores[chave] = item[0]
+            else:
+                faltando.append(chave)
+
+        if faltando:
+            conn = self._connect()
+            try:
+                rows = []
+                for i in range(0, len(faltando), LOTE_CONSULTA):
+                    lote = faltando[i:i + LOTE_CONSULTA]
+                    rows.extend(conn.execute(
+                        f"SELECT chave, valor, expira_em FROM cache WHERE namespace = ? "
+                        f"AND chave IN ({', '.join('?' * len(lote))})",
+                        (self.namespace, *lote)
+                    ).fetchall())
+            finally:
+                conn.close()
+            for chave, valor, expira_em in rows:
+                if expira_em > agora:
+                    valores[chave] = json.loads(valor)
+                    self._remember(chave, valores[chave], expira_em)
+        return {key: valores.get(chave, default) for key, chave in chaves.items()}
+
+    def set(self, key, value, ttl=None):
+        """
+        Grava o valor nas duas camadas. 'ttl' permite prazos menores, por exemplo
+        para cache negativo (consultas sem resultado).
+        """
+        chave = self._key(key)
+        expira_em = time.time() + (self.ttl if ttl is None else ttl)
+        self._remember(chave, value, expira_em)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, chave, valor, expira_em) VALUES (?, ?, ?, ?)",
+                (self.namespace, chave, json.dumps(value, ensure_ascii=False), expira_em)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def __contains__(self, key):
+        return self.get(key, self.MISSING) is not self.MISSING
+
+    def purge_expired(self):
+        """
+        Remove do SQLite as entradas expiradas deste namespace.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND expira_em <= ?",
+                         (self.namespace, time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._memory.clear()
@@ -0,0 +1,183 @@
+import math
+import os
+import numpy as np
+from modules.doc_processing import dividir_em_blocos
+from modules.summarization import dividir_frases, textrank
+
+try:
+    import tiktoken
+except ImportError:
+    # Dependência opcional (requirements-opcional.txt): sem ela, os tokens são estimados pelo tamanho do texto
+    tiktoken = None
+
+# Orçamento (em tokens) do contexto enviado ao LLM: tópicos + resumo + trechos dos textos.
+# As instruções fixas do prompt ficam fora da conta.
+ORCAMENTO_CONTEXTO = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+
+# Fatia do orçamento reservada a cada seção; o que tópicos e resumo não usarem vai para os textos
+FRACAO_TOPICOS = 0.25
+FRACAO_RESUMO = 0.15
+
+# Frases mais centrais levadas ao prompt por tópico
+MAX_FRASES_POR_TOPICO = 5
+
+# Estimativa sem tokenizador: caracteres por token (conservadora para português)
+CHARS_POR_TOKEN = 3.5
+
+# Blocos da etapa "map" da condensação e quanto cada bloco guarda antes do "reduce"
+# (ao menos MIN_TOKENS_BLOCO, para que cada bloco contribua com frases inteiras)
+MAX_CHARS_BLOCO_CONDENSACAO = 20_000
+FATOR_MAPA = 2
+MIN_TOKENS_BLOCO = 150
+
+_codificador = None
+
+
+def contar_tokens(texto):
+    """
+    Número de tokens do texto, contado localmente: tiktoken (o200k_base, o vocabulário
+    do gpt-4o-mini) se instalado; senão, estimativa pelo número de caracteres.
+    """
+    global _codificador
+    if not texto:
+        return 0
+    if tiktoken is not None:
+        if _codificador is None:
+            _codificador = tiktoken.get_encoding("o200k_base")
+        return len(_codificador.encode(texto, disallowed_special=()))
+    return math.ceil(len(texto) / CHARS_POR_TOKEN)
+
+
+def _truncar(texto, orcamento):
+    # Último recurso quando nem uma frase inteira cabe no orçamento
+    limite = max(0, int(orcamento * CHARS_POR_TOKEN))
+    while limite > 0 and contar_tokens(texto[:limite]) > orcamento:
+        limite = int(limite * 0.9)
+    return texto[:limite]
+
+
+def selecionar_frases(frases, escores, orcamento):
+    """
+    Frases de maior escore que cabem juntas no orçamento, na ordem original.
+    :return: Lista de índices das frases escolhidas.
+    """
+    escolhidas, usados = [], 0
+    for i in np.argsort(-np.asarray(escores), kind="stable"):
+        custo = contar_tokens(frases[i]) + 1
+        if usados + custo <= orcamento:
+            escolhidas.append(int(i))
+            usados += custo
+    return sorted(escolhidas)
+
+
+def _extrair_centrais(texto, orcamento):
+    frases = dividir_frases(texto)
+    escolhidas = selecionar_frases(frases, textrank(frases), orcamento)
+    if not escolhidas:
+        return _truncar(texto, orcamento)
+    return " ".join(frases[i] for i in escolhidas)
+
+
+def condensar_texto(texto, orcamento):
+    """
+    Reduz o texto ao orçamento de tokens com frases do próprio texto.
+    Textos longos passam por map-reduce: cada bloco é condensado (map) a uma fatia
+    proporcional do orçamento (com folga FATOR_MAPA, mínimo MIN_TOKENS_BLOCO) e a
+    concatenação é condensada de novo pelo TextRank global (reduce).
+    """
+    total = contar_tokens(texto)
+    if total <= orcamento:
+        return texto
+    blocos = dividir_em_blocos(texto, MAX_CHARS_BLOCO_CONDENSACAO)
+    if len(blocos) == 1:
+        return _extrair_centrais(texto, orcamento)
+
+    parciais = []
+    for _, bloco in blocos:
+        fatia = max(MIN_TOKENS_BLOCO, int(orcamento * FATOR_MAPA * contar_tokens(bloco) / total))
+        parciais.append(_extrair_centrais(bloco, fatia))
+    print(f">>> [PROMPT] {len(blocos)} bloco(s) condensados; reduzindo a {orcamento} tokens...")
+    return _extrair_centrais("\n\n".join(p for p in parciais if p.strip()), orcamento)
+
+
+def _cabecalho_topico(n):
+    return f"Tópico {n}:\n"
+
+
+def _item_topico(frase):
+    return f"- {frase}\n"
+
+
+def frases_centrais_por_topico(topicos, orcamento, max_por_topico=MAX_FRASES_POR_TOPICO):
+    """
+    Escolhe as frases mais centrais (TextRank dentro do cluster) de cada tópico,
+    alternando entre os tópicos para que todos apareçam antes que o orçamento acabe.
+    O custo conta os cabeçalhos "Tópico N:" e os marcadores de formatar_topicos.
+    Se nem a frase mais central de um tópico couber na fatia dele, ela entra truncada.
+    :param topicos: {id: [frases]} como em TextProcessor.topicos.
+    :return: {id: [frases escolhidas]}, na ordem de centralidade.
+    """
+    ordenadas = {}
+    for t, frases in topicos.items():
+        frases = list(dict.fromkeys(f.strip() for f in frases if f.strip()))
+        if not frases:
+            continue
+        escores = textrank(frases)
+        ordenadas[t] = [frases[i] for i in np.argsort(-escores, kind="stable")[:max_por_topico]]
+
+    usados = sum(contar_tokens(_cabecalho_topico(n)) for n in range(1, len(ordenadas) + 1))
+    escolhidas = {t: [] for t in ordenadas}
+    if not ordenadas or usados >= orcamento:
+        return escolhidas
+    # Fatia de cada tópico na primeira rodada (a frase mais central de cada um)
+    fatia = (orcamento - usados) // len(ordenadas)
+    for posicao in range(max_por_topico):
+        for t, frases in ordenadas.items():
+            if posicao >= len(frases):
+                continue
+            frase = frases[posicao]
+            custo = contar_tokens(_item_topico(frase))
+            if posicao == 0 and custo > fatia:
+                frase = _truncar(frase, fatia - contar_tokens(_item_topico("")))
+                custo = contar_tokens(_item_topico(frase))
+                if not frase:
+                    continue
+            if usados + custo <= orcamento:
+                escolhidas[t].append(frase)
+                usados += custo
+    return escolhidas
+
+
+def formatar_topicos(centrais):
+    """
+    Seção de tópicos do prompt: "Tópico N:" seguido de uma linha "- frase" por frase.
+    """
+    return "".join(
+        _cabecalho_topico(n) + "".join(_item_topico(f) for f in frases)
+        for n, frases in enumerate((f for f in centrais.values() if f), start=1)
+    ).rstrip("\n")
+
+
+def montar_contexto(resumo, topicos, textos, orcamento=None):
+    """
+    Monta as seções de contexto do prompt dentro do orçamento de tokens, qualquer
+    que seja o tamanho da entrada.
+    :return: Dicionário com 'topicos', 'resumo' e 'textos' (strings prontas para o
+             prompt) e 'tokens' (uso por seção).
+    """
+    orcamento = orcamento or ORCAMENTO_CONTEXTO
+    centrais = frases_centrais_por_topico(topicos or {}, int(orcamento * FRACAO_TOPICOS))
+    secao_topicos = formatar_topicos(centrais)
+    secao_resumo = condensar_texto(resumo or "", int(orcamento * FRACAO_RESUMO))
+    restante = orcamento - contar_tokens(secao_topicos) - contar_tokens(secao_resumo)
+    secao_textos = condensar_texto(textos or "", max(restante, 0))
+
+    tokens = {
+        "topicos": contar_tokens(secao_topicos),
+        "resumo": contar_tokens(secao_resumo),
+        "textos": contar_tokens(secao_textos),
+        "textos_originais": contar_tokens(textos or "")
+    }
+    print(f">>> [PROMPT] Contexto com {tokens['topicos'] + tokens['resumo'] + tokens['textos']} "
+          f"de {orcamento} tokens (textos: {tokens['textos_originais']} -> {tokens['textos']}).")
+    return {"topicos": secao_topicos, "resumo": secao_resumo, "textos": secao_textos, "tokens": tokens}
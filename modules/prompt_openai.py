@@ -1,11 +1,11 @@
 from openai import OpenAI
-from summarizer import Summarizer
 import os
 from dotenv import load_dotenv
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.cluster import KMeans
 import requests
 from goose3 import Goose
+from modules.model_registry import get_model
 
 class EntityClassifier:
     """
@@ -21,7 +21,8 @@ class EntityClassifier:
 
         self.client = OpenAI(api_key=openai_api_key)
 
-        self.bert_model = Summarizer()
+        # Summarizer compartilhado (registro de modelos)
+        self.bert_model = get_model("summarizer")
         resumo = classifier.bert_model(text)
 
         # Clustering de tópicos
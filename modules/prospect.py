@@ -1,60 +1,47 @@
 from openai import OpenAI
-from summarizer import Summarizer
 import os
 from dotenv import load_dotenv
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-import numpy as np
 from goose3 import Goose
 import json
-import spacy
 import time  # Para gerar a timestamp
-from sentence_transformers import SentenceTransformer
 import webbrowser
-
-# Carregar o modelo de linguagem do spaCy
-nlp = spacy.load("pt_core_news_sm")
+from modules.model_registry import get_model
+from modules.doc_processing import extrair_frases
+from modules.summarization import resumir
+from modules.topic_engine import extrair_topicos
+from modules.prompt_budget import montar_contexto
 
 class TextProcessor:
     """
     Classe responsável por processar o texto, gerar o resumo e extrair os tópicos.
     """
-    def __init__(self, text):
+    def __init__(self, text, modo_resumo=None):
         self.text = text
-        self.bert_model = Summarizer()
+        self.modo_resumo = modo_resumo  # "bert", "rapido" ou None (SUMMARY_MODE)
         self.resumo = None
         self.topicos = None
 
+    @property
+    def bert_model(self):
+        """Summarizer compartilhado (registro de modelos)."""
+        return get_model("summarizer")
+
     def process_text(self):
         """Gera o resumo e os tópicos a partir do texto."""
         print("Processando texto para gerar resumo e tópicos...")
-        # Gerar resumo usando BERT Summarizer
-        self.resumo = self.bert_model(self.text)
+        # Gerar resumo extrativo (BERT Summarizer ou TextRank, com cache)
+        self.resumo = resumir(self.text, modo=self.modo_resumo)
         print("Resumo gerado com sucesso.")
 
         # Processar o texto em frases usando spaCy
-        doc = nlp(self.text)
-        frases = [sent.text for sent in doc.sents]
+        frases = [frase for frase, _, _ in extrair_frases(get_model("spacy"), self.text)]
         print(f"Texto dividido em {len(frases)} frases.")
 
         # Clustering de tópicos com Sentence-BERT
         if len(frases) > 1:
             print("Realizando clustering de tópicos com Sentence-BERT...")
-            # Carregar o modelo Sentence-BERT
-            model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
-            # Gerar embeddings das frases
-            sentence_embeddings = model.encode(frases)
-            # Aplicar K-Means nos embeddings
-            num_clusters = min(3, len(frases))
-            kmeans = KMeans(n_clusters=num_clusters, random_state=42)
-            clusters = kmeans.fit_predict(sentence_embeddings)
-
-            self.topicos = {}
-            for i, c in enumerate(clusters):
-                if c not in self.topicos:
-                    self.topicos[c] = []
-                self.topicos[c].append(frases[i])
-
+            # Motor de tópicos compartilhado (MiniBatchKMeans, k automático, cache por hash)
+            self.topicos = extrair_topicos(frases, representacao="embeddings")["clusters"]
             print("Clustering de tópicos concluído.")
         else:
             self.topicos = {"0": ["Não há frases suficientes para clustering."]}
@@ -67,7 +54,7 @@ class ScenarioClassifier:
     Classe responsável por gerar cenários (imediato, curto, médio e longo prazos),
     usando as informações de resumo, tópicos e texto original.
     """
-    def __init__(self, resumo, topicos, combined_text):
+    def __init__(self, resumo, topicos, combined_text, orcamento_tokens=None):
         # Carregar variáveis de ambiente
         load_dotenv()
         openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -78,14 +65,28 @@ class ScenarioClassifier:
         self.resumo = resumo
         self.topicos = topicos
         self.combined_text = combined_text
+        self.orcamento_tokens = orcamento_tokens  # None usa PROMPT_TOKEN_BUDGET
 
     def generate_prompt(self):
-        """Gera o prompt final para a OpenAI."""
+        """
+        Gera o prompt final para a OpenAI. O contexto (frases centrais de cada tópico,
+        resumo e trechos dos textos) é limitado a um orçamento de tokens, então o
+        tamanho do prompt não cresce com o volume de links raspados.
+        """
         print("Gerando prompt para a OpenAI...")
+        contexto = montar_contexto(self.resumo, self.topicos, self.combined_text, self.orcamento_tokens)
         prompt_final = f'''
-        Você é um assistente que receberá esta lista de tópicos {self.topicos} elaborada por
-        sklearn e sentence-BERT, um resumo {self.resumo} elaborado por bert-summarizer, 
-        e os textos originais {self.combined_text}. Partindo daí, você deverá retornar
+        Você é um assistente que receberá as frases mais representativas de cada tópico,
+        agrupados por sklearn e sentence-BERT:
+        {contexto["topicos"]}
+
+        um resumo elaborado por bert-summarizer:
+        {contexto["resumo"]}
+
+        e os trechos mais centrais dos textos originais:
+        {contexto["textos"]}
+
+        Partindo daí, você deverá retornar
         um arquivo json estruturado prevendo cenários que se organizam seguindo
         este diagrama de quatro linhas por três colunas:
 
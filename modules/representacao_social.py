@@ -1,171 +1,893 @@
 import re
+import json
+from array import array
+from functools import lru_cache
+import numpy as np
 import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import minimum_spanning_tree
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import os
+import threading
 import time
 import nltk
 from nltk.corpus import stopwords
 
+from modules.db_manager import (
+    calculate_hash,
+    memoize_result,
+    store_memo_result,
+    iter_conteudos_ingestao
+)
+
+
+# Padrões pré-compilados do tokenizador (um único passe por frase)
+_PONTUACAO_RE = re.compile(r'[^\w\s]+')
+_NUMERO_RE = re.compile(r'\d+(?:st|nd|rd|th)?')
+
+COLUNAS_TABELA = ["palavra", "frequencia", "OME", "zona"]
+ZONAS = ["Núcleo Central", "Zona Periférica 1", "Zona Periférica 2", "Zona Periférica 3"]
+CORES_ZONAS = ["tab:red", "tab:orange", "tab:blue", "tab:grey"]
+INDICES_SIMILITUDE = ("cosseno", "jaccard", "coocorrencia")
+
+# Cache em memória das tabelas base: {(hash do texto, aplicar_filtro, lemas): DataFrame}
+# (acessado pelas threads do Flask só sob _CACHE_EVOCACOES_LOCK)
+_CACHE_EVOCACOES = {}
+_CACHE_EVOCACOES_MAX = 32
+_CACHE_EVOCACOES_LOCK = threading.Lock()
+
+# Agregadores mantidos entre requisições, um por DB: {(db_path, aplicar_filtro, lemas): AgregadorEvocacoes}
+_AGREGADORES_DB = {}
+_AGREGADORES_LOCK = threading.Lock()
+
+# Visões de corpus (mescla dos agregadores por DB): {(dbs, aplicar_filtro, lemas): (assinatura, agregador)}
+_VISOES_CORPUS = {}
+_VISOES_CORPUS_MAX = 8
+
+
+def tokenizar_evocacoes(textos, aplicar_filtro=True, vocabulario=None):
+    """
+    Tokeniza os textos em um único passe, já aplicando o filtro de números/emojis.
+    :param textos: Lista de textos (cada texto é tratado como um respondente).
+    :param aplicar_filtro: Define se números e numerais ordinais serão descartados.
+    :param vocabulario: Dicionário {palavra: id} opcional, atualizado in-place.
+    :return: Tupla (vocabulario, palavra_ids, ordens), com arrays NumPy int32.
+    """
+    if vocabulario is None:
+        vocabulario = {}
+    palavra_ids = array('i')
+    ordens = array('i')
+    for texto in textos:
+        ordem = 0
+        # Emojis e pontuação caem junto, pois nenhum deles casa com \w
+        for token in _PONTUACAO_RE.sub('', texto).split():
+            if aplicar_filtro and _NUMERO_RE.fullmatch(token):
+                continue
+            ordem += 1
+            token = token.lower()
+            palavra_ids.append(vocabulario.setdefault(token, len(vocabulario)))
+            ordens.append(ordem)
+    return (
+        vocabulario,
+        np.frombuffer(palavra_ids, dtype=np.int32),
+        np.frombuffer(ordens, dtype=np.int32)
+    )
+
+
+def lematizar_evocacoes(nlp, textos, aplicar_filtro=True, vocabulario=None,
+                        batch_size=256, n_process=1):
+    """
+    Variante de tokenizar_evocacoes que conta lemas em vez de formas de superfície
+    ("governo"/"governos" somam na mesma palavra). Usa nlp.pipe em lotes, sem
+    parser e NER, reaproveitando o modelo spaCy já carregado.
+    :param nlp: Modelo spaCy (por exemplo, EntityClassifier.nlp).
+    :param textos: Lista de textos (cada texto é tratado como um respondente).
+    :param aplicar_filtro: Define se números e numerais ordinais serão descartados.
+    :param vocabulario: Dicionário {lema: id} opcional, atualizado in-place.
+    :param batch_size: Quantidade de textos por lote do nlp.pipe.
+    :param n_process: Número de processos do nlp.pipe.
+    :return: Tupla (vocabulario, palavra_ids, ordens), com arrays NumPy int32.
+    """
+    if vocabulario is None:
+        vocabulario = {}
+    palavra_ids = array('i')
+    ordens = array('i')
+    docs = nlp.pipe(textos, batch_size=batch_size, n_process=n_process, disable=["parser", "ner"])
+    for doc in docs:
+        ordem = 0
+        for token in doc:
+            if token.is_punct or token.is_space:
+                continue
+            if aplicar_filtro and _NUMERO_RE.fullmatch(token.text):
+                continue
+            lema = _PONTUACAO_RE.sub('', token.lemma_ or token.text).lower()
+            if not lema:
+                continue
+            ordem += 1
+            palavra_ids.append(vocabulario.setdefault(lema, len(vocabulario)))
+            ordens.append(ordem)
+    return (
+        vocabulario,
+        np.frombuffer(palavra_ids, dtype=np.int32),
+        np.frombuffer(ordens, dtype=np.int32)
+    )
+
+
+def montar_tabela_evocacoes(palavras, frequencia, soma_ordens):
+    """
+    Monta a tabela de frequência, OME e zonas a partir dos agregados por palavra.
+    :param palavras: Sequência de palavras, alinhada aos arrays de agregados.
+    :param frequencia: Array com a frequência de cada palavra.
+    :param soma_ordens: Array com a soma das ordens de evocação de cada palavra.
+    :return: DataFrame com as colunas palavra, frequencia, OME e zona.
+    """
+    palavras = np.asarray(palavras, dtype=object)
+    frequencia = np.asarray(frequencia, dtype=np.int64)
+    soma_ordens = np.asarray(soma_ordens, dtype=np.float64)
+    presentes = frequencia > 0
+    palavras, frequencia, soma_ordens = palavras[presentes], frequencia[presentes], soma_ordens[presentes]
+
+    ome = soma_ordens / frequencia
+    # Ordena por frequência decrescente, preservando a ordem de aparição nos empates
+    indices = np.argsort(-frequencia, kind='stable')
+    resultado = pd.DataFrame({
+        'palavra': palavras[indices],
+        'frequencia': frequencia[indices],
+        'OME': ome[indices]
+    })
+    freq_quartil = resultado['frequencia'].median()
+    ome_quartil = resultado['OME'].median()
+    freq_alta = resultado['frequencia'].to_numpy() > freq_quartil
+    ome_baixa = resultado['OME'].to_numpy() <= ome_quartil
+    resultado['zona'] = np.select(
+        [freq_alta & ome_baixa, ~freq_alta & ome_baixa, freq_alta & ~ome_baixa],
+        ZONAS[:3],
+        default=ZONAS[3]
+    )
+    return resultado
+
+
+def matriz_incidencia(palavra_ids, ordens, n_tipos, respondentes=None):
+    """
+    Monta a matriz esparsa binária respondentes x palavras (CSR).
+    Sem 'respondentes', cada respondente começa onde a ordem de evocação volta a 1.
+    :param palavra_ids: Array de ids de palavra.
+    :param ordens: Array de ordens de evocação, alinhado a palavra_ids.
+    :param n_tipos: Tamanho do vocabulário.
+    :param respondentes: Array opcional com o id do respondente de cada evocação.
+    :return: scipy.sparse.csr_matrix com 1 onde o respondente evocou a palavra.
+    """
+    if respondentes is None:
+        respondentes = np.cumsum(ordens == 1) - 1
+    n_respondentes = int(respondentes.max()) + 1 if len(respondentes) else 0
+    matriz = sparse.csr_matrix(
+        (np.ones(len(palavra_ids), dtype=np.float32), (respondentes, palavra_ids)),
+        shape=(n_respondentes, n_tipos)
+    )
+    # Repetições da palavra no mesmo respondente contam uma única vez
+    matriz.data[:] = 1
+    return matriz
+
+
+def analise_similitude(incidencia, palavras, n_palavras=50, indice="cosseno",
+                       min_coocorrencia=1, excluir=None):
+    """
+    Análise de similitude: coocorrência entre palavras nos mesmos respondentes,
+    índice de associação e árvore geradora máxima das palavras mais centrais.
+    Todas as etapas permanecem esparsas.
+    :param incidencia: Matriz respondentes x palavras (ver matriz_incidencia).
+    :param palavras: Sequência de palavras, indexada pelos ids da matriz.
+    :param n_palavras: Quantidade de palavras mais frequentes na árvore (None para todas).
+    :param indice: 'cosseno', 'jaccard' ou 'coocorrencia'.
+    :param min_coocorrencia: Coocorrência mínima para que uma aresta seja considerada.
+    :param excluir: Conjunto de palavras a ignorar (por exemplo, stopwords).
+    :return: Dicionário com { 'vertices': [...], 'arestas': [...] }.
+    """
+    freq_respondentes = np.asarray(incidencia.sum(axis=0)).ravel()
+    candidatos = np.flatnonzero(freq_respondentes)
+    if excluir:
+        candidatos = np.array([i for i in candidatos if palavras[i] not in excluir], dtype=np.int64)
+    ordem_freq = np.argsort(-freq_respondentes[candidatos], kind='stable')
+    selecionadas = candidatos[ordem_freq[:n_palavras] if n_palavras else ordem_freq]
+    k = len(selecionadas)
+    if k == 0:
+        # Nenhuma palavra (texto vazio ou tudo filtrado): nada a montar
+        return {"indice": indice, "vertices": [], "arestas": []}
+
+    sub = incidencia[:, selecionadas].tocsc()
+    coocorrencia = sparse.triu(sub.T @ sub, k=1).tocoo()
+    manter = coocorrencia.data >= min_coocorrencia
+    i, j = coocorrencia.row[manter], coocorrencia.col[manter]
+    c = coocorrencia.data[manter].astype(np.float64)
+    f = freq_respondentes[selecionadas]
+
+    if indice == "jaccard":
+        pesos = c / (f[i] + f[j] - c)
+    elif indice == "coocorrencia":
+        pesos = c
+    else:
+        pesos = c / np.sqrt(f[i] * f[j])
+
+    # Árvore geradora máxima = mínima sobre os pesos negativos
+    arvore = minimum_spanning_tree(sparse.csr_matrix((-pesos, (i, j)), shape=(k, k))).tocoo()
+    contagens = sparse.csr_matrix((c, (i, j)), shape=(k, k))
+
+    arestas = []
+    for a, b, peso in zip(arvore.row, arvore.col, arvore.data):
+        a, b = min(a, b), max(a, b)
+        arestas.append({
+            "origem": palavras[selecionadas[a]],
+            "destino": palavras[selecionadas[b]],
+            "peso": float(-peso),
+            "coocorrencias": int(contagens[a, b])
+        })
+    arestas.sort(key=lambda aresta: aresta["peso"], reverse=True)
+
+    return {
+        "indice": indice,
+        "vertices": [
+            {"palavra": palavras[idx], "frequencia": int(freq)}
+            for idx, freq in zip(selecionadas, f)
+        ],
+        "arestas": arestas
+    }
+
 
 class RepresentacaoSocial:
-    def __init__(self, textos, aplicar_filtro=True):
+    def __init__(self, textos, aplicar_filtro=True, nlp=None, n_process=1):
         """
         Inicializa a classe com os textos e prepara os dados.
         :param textos: Lista de textos para análise.
         :param aplicar_filtro: Define se o filtro de números e emojis será aplicado.
+        :param nlp: Modelo spaCy; se informado, as evocações são contadas por lema.
+        :param n_process: Número de processos usados na lematização.
         """
-        self.textos = [self._limpar_pontuacao(texto) for texto in textos]
-        self.data = self._preparar_dados(aplicar_filtro=aplicar_filtro)
-
-    def _limpar_pontuacao(self, texto):
-        """
-        Remove pontuação de um texto.
-        :param texto: Texto de entrada.
-        :return: Texto sem pontuação.
-        """
-        return re.sub(r'[^\w\s]', '', texto)
+        self.textos = textos
+        # Id do respondente de cada evocação; None quando derivável das ordens (uma frase por respondente)
+        self.respondentes = None
+        if nlp is not None:
+            vocabulario, self.palavra_ids, self.ordens = lematizar_evocacoes(
+                nlp, textos, aplicar_filtro=aplicar_filtro, n_process=n_process
+            )
+        else:
+            vocabulario, self.palavra_ids, self.ordens = tokenizar_evocacoes(
+                textos, aplicar_filtro=aplicar_filtro
+            )
+        self.vocabulario = np.array(list(vocabulario), dtype=object)
 
-    def _remover_numeros_emojis(self, texto):
+    @classmethod
+    def de_evocacoes(cls, vocabulario, palavra_ids, ordens, respondentes=None):
         """
-        Remove números, numerais ordinais e emojis de um texto.
-        :param texto: Texto de entrada.
-        :return: Texto sem números, numerais ordinais e emojis.
+        Cria a análise diretamente a partir de arrays de evocação já vetorizados
+        (por exemplo, um questionário de associação livre).
+        :param vocabulario: Sequência de palavras, indexada pelos ids.
+        :param palavra_ids: Array de ids de palavra.
+        :param ordens: Array com a ordem (rank) de cada evocação.
+        :param respondentes: Array com o id do respondente de cada evocação.
+        :return: Instância de RepresentacaoSocial.
         """
-        texto = re.sub(r'\b\d+\b', '', texto)  # Remove números inteiros
-        texto = re.sub(r'\b\d+(?:st|nd|rd|th)\b', '', texto)  # Remove numerais ordinais
-        texto = re.sub(r'[^\w\s,]', '', texto)  # Remove emojis
-        return texto
+        analise = cls.__new__(cls)
+        analise.textos = None
+        analise.vocabulario = np.array(list(vocabulario), dtype=object)
+        analise.palavra_ids = np.asarray(palavra_ids)
+        analise.ordens = np.asarray(ordens)
+        analise.respondentes = None if respondentes is None else np.asarray(respondentes)
+        return analise
 
-    def _preparar_dados(self, aplicar_filtro=True):
+    @property
+    def data(self):
         """
-        Prepara os dados para análise.
-        :param aplicar_filtro: Define se o filtro de números e emojis será aplicado.
-        :return: DataFrame com palavras e suas ordens.
+        DataFrame com palavras e suas ordens, montado sob demanda a partir dos arrays.
         """
-        palavras = []
-        ordem = []
-        for i, texto in enumerate(self.textos):
-            texto_limpo = self._remover_numeros_emojis(texto) if aplicar_filtro else texto
-            for j, palavra in enumerate(texto_limpo.split(), start=1):
-                palavras.append(palavra.lower())
-                ordem.append(j)
-        return pd.DataFrame({'palavra': palavras, 'ordem': ordem})
+        return pd.DataFrame({'palavra': self.vocabulario[self.palavra_ids], 'ordem': self.ordens})
 
     def calcular_frequencia_ome(self):
         """
         Calcula frequência, OME (Ordem Média de Evocação) e determina as zonas.
         :return: DataFrame com os resultados.
         """
-        frequencia = self.data['palavra'].value_counts().reset_index()
-        frequencia.columns = ['palavra', 'frequencia']
-        ome = self.data.groupby('palavra')['ordem'].mean().reset_index()
-        ome.columns = ['palavra', 'OME']
-        resultado = pd.merge(frequencia, ome, on='palavra')
-        freq_quartil = resultado['frequencia'].median()
-        ome_quartil = resultado['OME'].median()
-        resultado['zona'] = resultado.apply(
-            lambda row: (
-                "Núcleo Central" if row['frequencia'] > freq_quartil and row['OME'] <= ome_quartil else
-                "Zona Periférica 1" if row['frequencia'] <= freq_quartil and row['OME'] <= ome_quartil else
-                "Zona Periférica 2" if row['frequencia'] > freq_quartil and row['OME'] > ome_quartil else
-                "Zona Periférica 3"
-            ),
-            axis=1
-        )
+        n_palavras = len(self.vocabulario)
+        frequencia = np.bincount(self.palavra_ids, minlength=n_palavras)
+        soma_ordens = np.bincount(self.palavra_ids, weights=self.ordens, minlength=n_palavras)
+        resultado = montar_tabela_evocacoes(self.vocabulario, frequencia, soma_ordens)
         self.resultado = resultado
         return resultado
 
-    def gerar_grafico(self, df, filtro, zona, upload_folder):
+    def calcular_similitude(self, n_palavras=50, indice="cosseno", min_coocorrencia=1, excluir=None):
+        """
+        Calcula a análise de similitude (coocorrência por frase/respondente).
+        :return: Dicionário com vértices e arestas da árvore máxima.
+        """
+        incidencia = matriz_incidencia(
+            self.palavra_ids, self.ordens, len(self.vocabulario), respondentes=self.respondentes
+        )
+        return analise_similitude(
+            incidencia, self.vocabulario, n_palavras=n_palavras, indice=indice,
+            min_coocorrencia=min_coocorrencia, excluir=excluir
+        )
+
+    @staticmethod
+    def gerar_grafico_quadrantes(df, freq_corte, ome_corte, filtro, upload_folder, max_rotulos=40):
         """
-        Gera um gráfico baseado nos dados filtrados.
-        :param df: DataFrame com os dados filtrados.
+        Gera um único gráfico de quatro quadrantes (Vergès) com todas as zonas.
+        :param df: DataFrame com os dados filtrados (colunas frequencia, OME, zona, palavra).
+        :param freq_corte: Mediana da frequência, usada como linha de corte vertical.
+        :param ome_corte: Mediana da OME, usada como linha de corte horizontal.
         :param filtro: Tipo de filtro aplicado.
-        :param zona: Zona correspondente.
         :param upload_folder: Caminho para salvar o gráfico.
+        :param max_rotulos: Quantidade máxima de palavras rotuladas (as mais frequentes).
         :return: Caminho do gráfico gerado.
         """
-        plt.figure(figsize=(6, 4))
-        plt.scatter(df['frequencia'], df['OME'])
-        plt.title(f"Gráfico para {filtro.capitalize()} Stopwords e {zona}")
-        plt.xlabel('Frequência')
-        plt.ylabel('OME')
+        fig, ax = plt.subplots(figsize=(8, 6))
+        for zona, cor in zip(ZONAS, CORES_ZONAS):
+            zona_dados = df[df['zona'] == zona]
+            if zona_dados.empty:
+                continue
+            ax.scatter(zona_dados['frequencia'], zona_dados['OME'], color=cor, label=zona, alpha=0.8)
+        ax.axvline(freq_corte, color='grey', linestyle='--', linewidth=1)
+        ax.axhline(ome_corte, color='grey', linestyle='--', linewidth=1)
+        for row in df.nlargest(max_rotulos, 'frequencia').itertuples(index=False):
+            ax.annotate(row.palavra, (row.frequencia, row.OME), fontsize=7,
+                        xytext=(3, 3), textcoords='offset points')
+        ax.set_title(f"Quadrantes de Vergès - {filtro.capitalize()} Stopwords")
+        ax.set_xlabel('Frequência')
+        ax.set_ylabel('OME')
+        if not df.empty:
+            ax.legend(fontsize=8)
         filepath = os.path.join(upload_folder, f"grafico_{time.time()}.png")
-        plt.savefig(filepath)
-        plt.close()
+        fig.savefig(filepath)
+        plt.close(fig)
         return filepath
 
 
-def process_representacao_social(text, request_form, upload_folder):
+def _normalizar_evocacoes(serie):
+    """
+    Normaliza, de forma vetorizada, as palavras evocadas (pontuação, espaços e caixa).
+    Expressões com mais de uma palavra são mantidas como uma única evocação.
+    """
+    serie = serie.astype(str).str.replace(_PONTUACAO_RE.pattern, '', regex=True)
+    return serie.str.replace(r'\s+', ' ', regex=True).str.strip().str.lower()
+
+
+def _lotes_questionario(arquivo, nome, tamanho_lote, separador):
+    """
+    Lê o arquivo de questionário (CSV ou XLSX) em lotes de DataFrames.
+    """
+    if nome.lower().endswith(('.xlsx', '.xls')):
+        # Planilhas não têm leitura em lotes no pandas; fatiamos após a leitura
+        df = pd.read_excel(arquivo, dtype=str)
+        for inicio in range(0, len(df), tamanho_lote):
+            yield df.iloc[inicio:inicio + tamanho_lote]
+    else:
+        yield from pd.read_csv(arquivo, dtype=str, chunksize=tamanho_lote, sep=separador)
+
+
+# Cabeçalhos que identificam o respondente, e não uma evocação, no formato largo
+_NOMES_COLUNA_RESPONDENTE = {"id", "respondente", "participante", "sujeito", "codigo", "código"}
+
+
+def _parece_coluna_respondente(lote, coluna):
+    """
+    Indica se a coluna parece identificar o respondente: cabeçalho típico de
+    identificação ou valores todos numéricos e distintos.
+    """
+    if str(coluna).strip().lower() in _NOMES_COLUNA_RESPONDENTE:
+        return True
+    valores = lote[coluna].dropna()
+    return (not valores.empty and valores.is_unique
+            and pd.to_numeric(valores, errors='coerce').notna().all())
+
+
+def carregar_questionario(arquivo, nome=None, formato="larga", coluna_respondente=None,
+                          colunas_evocacao=None, coluna_palavra="palavra", coluna_ordem="ordem",
+                          separador=",", tamanho_lote=100_000):
+    """
+    Carrega um questionário de associação livre (CSV/XLSX) em lotes e o vetoriza em
+    arrays (palavra_id, ordem, respondente).
+    Formato 'larga': uma linha por respondente, uma coluna por posição de evocação
+    (na ordem das colunas). Formato 'longa': uma linha por evocação, com as colunas
+    de respondente, palavra e ordem.
+    :param arquivo: Caminho ou objeto de arquivo.
+    :param nome: Nome do arquivo, usado para detectar a extensão (padrão: o próprio caminho).
+    :param formato: 'larga' ou 'longa'.
+    :param coluna_respondente: Coluna de identificação do respondente (opcional no formato largo,
+        desde que o arquivo não tenha uma).
+    :param colunas_evocacao: Colunas de evocação no formato largo (padrão: todas, exceto a do respondente).
+    :param coluna_palavra: Coluna da palavra no formato longo.
+    :param coluna_ordem: Coluna da ordem no formato longo.
+    :param separador: Separador de campos do CSV.
+    :param tamanho_lote: Quantidade de linhas lidas por lote.
+    :return: RepresentacaoSocial pronta para calcular_frequencia_ome.
+    :raises ValueError: Se faltar a coluna de respondente (formato longo, ou formato
+        largo cuja primeira coluna parece identificar o respondente).
+    """
+    nome = nome or str(arquivo)
+    vocabulario = {}
+    respondentes_ids = {}
+    partes_palavras, partes_ordens, partes_respondentes = [], [], []
+    linhas_lidas = 0
+
+    for lote in _lotes_questionario(arquivo, nome, tamanho_lote, separador):
+        if formato == "longa":
+            if coluna_respondente is None:
+                raise ValueError("O formato longo exige a coluna de respondente.")
+            palavras = lote[coluna_palavra]
+            ordens = pd.to_numeric(lote[coluna_ordem], errors='coerce')
+            respondentes = lote[coluna_respondente]
+        else:
+            if (linhas_lidas == 0 and coluna_respondente is None and colunas_evocacao is None
+                    and len(lote.columns) and _parece_coluna_respondente(lote, lote.columns[0])):
+                raise ValueError(f"A coluna '{lote.columns[0]}' parece identificar o respondente; "
+                                 "informe-a em 'Coluna do Respondente'.")
+            colunas = colunas_evocacao or [c for c in lote.columns if c != coluna_respondente]
+            n_linhas, n_colunas = len(lote), len(colunas)
+            palavras = pd.Series(lote[colunas].to_numpy().ravel())
+            ordens = pd.Series(np.tile(np.arange(1, n_colunas + 1), n_linhas))
+            if coluna_respondente is not None:
+                respondentes = pd.Series(np.repeat(lote[coluna_respondente].to_numpy(), n_colunas))
+            else:
+                respondentes = pd.Series(np.repeat(np.arange(linhas_lidas, linhas_lidas + n_linhas), n_colunas))
+        linhas_lidas += len(lote)
+
+        validos = palavras.notna().to_numpy() & ordens.notna().to_numpy()
+        # Fatoração por lote: a normalização e os dicionários globais só veem os valores únicos
+        codigos, unicos = pd.factorize(palavras[validos])
+        normalizados = _normalizar_evocacoes(pd.Series(unicos, dtype=object))
+        mapa = np.fromiter(
+            (vocabulario.setdefault(p, len(vocabulario)) if p else -1 for p in normalizados),
+            dtype=np.int32, count=len(unicos)
+        )
+        palavra_ids = mapa[codigos]
+        nao_vazias = palavra_ids >= 0
+        partes_palavras.append(palavra_ids[nao_vazias])
+        ordens = ordens[validos].to_numpy()[nao_vazias]
+        codigos, unicos = pd.factorize(respondentes[validos].to_numpy()[nao_vazias])
+        mapa = np.fromiter((respondentes_ids.setdefault(r, len(respondentes_ids)) for r in unicos),
+                           dtype=np.int32, count=len(unicos))
+        partes_respondentes.append(mapa[codigos])
+        partes_ordens.append(ordens.astype(np.int32))
+
+    def _juntar(partes):
+        return np.concatenate(partes) if partes else np.zeros(0, dtype=np.int32)
+
+    return RepresentacaoSocial.de_evocacoes(
+        vocabulario, _juntar(partes_palavras), _juntar(partes_ordens), _juntar(partes_respondentes)
+    )
+
+
+class AgregadorEvocacoes:
+    """
+    Agregados parciais e mescláveis de evocações (frequência, soma das ordens e
+    contagens por palavra), atualizados documento a documento. Permite montar a
+    tabela de quatro quadrantes sobre um corpus inteiro sem reprocessá-lo.
+    """
+    def __init__(self, aplicar_filtro=True, nlp=None):
+        self.aplicar_filtro = aplicar_filtro
+        # Com um modelo spaCy, os agregados são feitos por lema
+        self.nlp = nlp
+        self.vocabulario = {}
+        self.frequencia = np.zeros(0, dtype=np.int64)
+        self.soma_ordens = np.zeros(0, dtype=np.int64)
+        self.n_respondentes = 0
+        self.n_documentos = 0
+        self.hashes = set()
+        self._tabela = None
+        # Último id de conteudos_ingestao lido em cada DB
+        self.ultimo_id = {}
+        # Serializa atualizações concorrentes (requisições Flask em threads)
+        self._lock = threading.Lock()
+
+    def _crescer(self):
+        """Estende os arrays de agregados até o tamanho atual do vocabulário."""
+        faltam = len(self.vocabulario) - len(self.frequencia)
+        if faltam > 0:
+            self.frequencia = np.concatenate([self.frequencia, np.zeros(faltam, dtype=np.int64)])
+            self.soma_ordens = np.concatenate([self.soma_ordens, np.zeros(faltam, dtype=np.int64)])
+
+    def adicionar_texto(self, text, hash_value=None):
+        """
+        Atualiza os agregados com um novo documento (cada frase é um respondente).
+        Documentos já vistos (mesmo hash) são ignorados.
+        :return: True se o documento foi incorporado.
+        """
+        hash_value = hash_value or calculate_hash(text)
+        if hash_value in self.hashes:
+            return False
+        textos = nltk.sent_tokenize(text)
+        if self.nlp is not None:
+            _, palavra_ids, ordens = lematizar_evocacoes(
+                self.nlp, textos, aplicar_filtro=self.aplicar_filtro, vocabulario=self.vocabulario
+            )
+        else:
+            _, palavra_ids, ordens = tokenizar_evocacoes(
+                textos, aplicar_filtro=self.aplicar_filtro, vocabulario=self.vocabulario
+            )
+        self._crescer()
+        n_palavras = len(self.vocabulario)
+        self.frequencia += np.bincount(palavra_ids, minlength=n_palavras)
+        self.soma_ordens += np.bincount(palavra_ids, weights=ordens, minlength=n_palavras).astype(np.int64)
+        self.n_respondentes += int(np.count_nonzero(ordens == 1))
+        self.n_documentos += 1
+        self.hashes.add(hash_value)
+        self._tabela = None
+        return True
+
+    def atualizar_db(self, db_path, tamanho_lote=100):
+        """
+        Incorpora, lote a lote, os conteúdos do DB ainda não lidos por este agregador.
+        :return: Número de documentos novos incorporados.
+        """
+        novos = 0
+        with self._lock:
+            for lote in iter_conteudos_ingestao(db_path, self.ultimo_id.get(db_path, 0), tamanho_lote):
+                for id_conteudo, hash_value, conteudo in lote:
+                    if conteudo and self.adicionar_texto(conteudo, hash_value):
+                        novos += 1
+                    self.ultimo_id[db_path] = id_conteudo
+        return novos
+
+    def mesclar(self, outro):
+        """
+        Soma os agregados de outro AgregadorEvocacoes (por exemplo, de outro DB ou worker).
+        Os dois agregadores devem cobrir documentos distintos.
+        :raises ValueError: Se outro for o próprio agregador.
+        """
+        if outro is self:
+            raise ValueError("Um agregador não pode ser mesclado consigo mesmo.")
+        # Locks sempre na mesma ordem: a.mesclar(b) e b.mesclar(a) simultâneos não travam
+        primeiro, segundo = sorted((self, outro), key=id)
+        with primeiro._lock, segundo._lock:
+            if outro.n_documentos == 0:
+                return self
+            mapa = np.fromiter(
+                (self.vocabulario.setdefault(palavra, len(self.vocabulario)) for palavra in outro.vocabulario),
+                dtype=np.int64,
+                count=len(outro.vocabulario)
+            )
+            self._crescer()
+            self.frequencia[mapa] += outro.frequencia[:len(mapa)]
+            self.soma_ordens[mapa] += outro.soma_ordens[:len(mapa)]
+            self.n_respondentes += outro.n_respondentes
+            self.n_documentos += outro.n_documentos
+            self.hashes |= outro.hashes
+            self._tabela = None
+            for db_path, ultimo in outro.ultimo_id.items():
+                self.ultimo_id[db_path] = max(ultimo, self.ultimo_id.get(db_path, 0))
+        return self
+
+    def tabela(self):
+        """
+        Monta a tabela de frequência/OME/zona sobre todo o corpus agregado.
+        A tabela é reaproveitada enquanto nenhum documento novo for incorporado.
+        """
+        if self._tabela is None:
+            self._tabela = montar_tabela_evocacoes(list(self.vocabulario), self.frequencia, self.soma_ordens)
+        return self._tabela
+
+
+def agregador_do_db(db_path, aplicar_filtro=True, tamanho_lote=100, nlp=None):
+    """
+    Retorna o agregador de evocações de um DB, atualizado de forma incremental:
+    apenas conteúdos inseridos desde a última chamada são processados.
+    """
+    chave = (db_path, aplicar_filtro, nlp is not None)
+    with _AGREGADORES_LOCK:
+        agregador = _AGREGADORES_DB.get(chave)
+        if agregador is None:
+            agregador = _AGREGADORES_DB[chave] = AgregadorEvocacoes(aplicar_filtro=aplicar_filtro, nlp=nlp)
+    agregador.atualizar_db(db_path, tamanho_lote=tamanho_lote)
+    return agregador
+
+
+def agregar_corpus(db_paths, aplicar_filtro=True, tamanho_lote=100, nlp=None):
+    """
+    Retorna o agregador de evocações de um conjunto de DBs. Cada DB mantém seu próprio
+    agregador incremental (ver agregador_do_db) e o corpus é a mescla deles, refeita
+    só quando algum DB recebe conteúdo novo; incluir um DB no escopo não reprocessa os demais.
+    Documentos repetidos em DBs diferentes contam uma vez por DB.
+    :param db_paths: Lista de caminhos de DB.
+    :param aplicar_filtro: Define se o filtro de números e emojis será aplicado.
+    :param tamanho_lote: Quantidade de linhas lidas por vez de cada DB.
+    :param nlp: Modelo spaCy; se informado, o corpus é agregado por lema.
+    :return: AgregadorEvocacoes com o corpus completo.
+    """
+    db_paths = tuple(sorted(p for p in db_paths if p and os.path.isfile(p)))
+    agregadores = [agregador_do_db(p, aplicar_filtro, tamanho_lote, nlp) for p in db_paths]
+    chave = (db_paths, aplicar_filtro, nlp is not None)
+    assinatura = tuple(a.n_documentos for a in agregadores)
+    with _AGREGADORES_LOCK:
+        em_cache = _VISOES_CORPUS.get(chave)
+    if em_cache is not None and em_cache[0] == assinatura:
+        return em_cache[1]
+
+    visao = AgregadorEvocacoes(aplicar_filtro=aplicar_filtro, nlp=nlp)
+    for agregador in agregadores:
+        visao.mesclar(agregador)
+    with _AGREGADORES_LOCK:
+        if chave not in _VISOES_CORPUS and len(_VISOES_CORPUS) >= _VISOES_CORPUS_MAX:
+            _VISOES_CORPUS.pop(next(iter(_VISOES_CORPUS)))
+        _VISOES_CORPUS[chave] = (assinatura, visao)
+    return visao
+
+
+@lru_cache(maxsize=1)
+def _stopwords_portugues():
+    """
+    Carrega a lista de stopwords em português uma única vez por processo.
+    """
+    return frozenset(stopwords.words('portuguese'))
+
+
+def _chave_evocacoes(text, aplicar_filtro, lemas=False):
+    """
+    Conteúdo usado como chave de memoização da tabela base no DB.
+    """
+    modo = "lemas" if lemas else "formas"
+    return f"evocacoes|extra_filter={'sim' if aplicar_filtro else 'nao'}|modo={modo}\n{text}"
+
+
+def obter_tabela_evocacoes(text, aplicar_filtro=True, db_path=None, nlp=None):
+    """
+    Retorna a tabela base (frequência/OME/zona) do texto, calculando-a uma única vez
+    por (hash do texto, filtro extra, modo). Consulta o cache em memória, depois a
+    tabela representacoes_sociais do DB e, só então, recalcula.
+    :param text: Texto para análise.
+    :param aplicar_filtro: Define se o filtro de números e emojis será aplicado.
+    :param db_path: Caminho do DB usado como segundo nível de cache (opcional).
+    :param nlp: Modelo spaCy; se informado, as evocações são contadas por lema.
+    :return: DataFrame com as colunas palavra, frequencia, OME e zona.
+    """
+    lemas = nlp is not None
+    chave = (calculate_hash(text), aplicar_filtro, lemas)
+    with _CACHE_EVOCACOES_LOCK:
+        resultado = _CACHE_EVOCACOES.get(chave)
+    if resultado is not None:
+        return resultado
+
+    if db_path and not os.path.isfile(db_path):
+        db_path = None
+    conteudo_chave = _chave_evocacoes(text, aplicar_filtro, lemas)
+    existente = memoize_result(db_path, "representacoes_sociais", conteudo_chave)
+    if existente:
+        try:
+            resultado = pd.DataFrame(json.loads(existente))
+        except (ValueError, TypeError):
+            resultado = None
+
+    if resultado is None:
+        textos = nltk.sent_tokenize(text)
+        resultado = RepresentacaoSocial(textos, aplicar_filtro=aplicar_filtro, nlp=nlp).calcular_frequencia_ome()
+        store_memo_result(db_path, "representacoes_sociais", conteudo_chave, json.dumps({
+            coluna: resultado[coluna].tolist() for coluna in resultado.columns
+        }, ensure_ascii=False))
+
+    with _CACHE_EVOCACOES_LOCK:
+        if chave not in _CACHE_EVOCACOES and len(_CACHE_EVOCACOES) >= _CACHE_EVOCACOES_MAX:
+            _CACHE_EVOCACOES.pop(next(iter(_CACHE_EVOCACOES)), None)
+        _CACHE_EVOCACOES[chave] = resultado
+    return resultado
+
+
+def filtrar_stopwords(resultado, stopwords_filter):
+    """
+    Aplica o filtro de stopwords como uma visão sobre a tabela base.
+    :param resultado: Tabela base de evocações.
+    :param stopwords_filter: 'com', 'sem' ou 'stopwords'.
+    :return: DataFrame filtrado.
+    """
+    if stopwords_filter == "sem":
+        return resultado[~resultado['palavra'].isin(_stopwords_portugues())]
+    if stopwords_filter == "stopwords":
+        return resultado[resultado['palavra'].isin(_stopwords_portugues())]
+    return resultado
+
+
+def filtrar_tabela(resultado, request_form):
+    """
+    Aplica os filtros de stopwords e de zona do formulário sobre a tabela base.
+    :param resultado: Tabela base de evocações.
+    :param request_form: Formulário (ou query string) com 'stopwords' e 'zone'.
+    :return: Tupla (DataFrame filtrado, lista de zonas selecionadas).
+    """
+    palavras = filtrar_stopwords(resultado, request_form.get('stopwords', 'com'))
+    zone_filter = request_form.get('zone', 'todas')
+    zonas = ZONAS if zone_filter == "todas" else [zone_filter]
+    return palavras[palavras['zona'].isin(zonas)], zonas
+
+
+def paginar_tabela(df, pagina=1, por_pagina=50, ordenar_por="frequencia", ordem="desc", busca=""):
+    """
+    Ordena, filtra por texto e pagina a tabela de evocações no servidor.
+    :param df: Tabela (já filtrada por stopwords/zona).
+    :param pagina: Página desejada, a partir de 1.
+    :param por_pagina: Quantidade de linhas por página (limitada a 500).
+    :param ordenar_por: Coluna de ordenação (uma de COLUNAS_TABELA).
+    :param ordem: 'asc' ou 'desc'.
+    :param busca: Trecho procurado na coluna 'palavra' (sem diferenciar maiúsculas).
+    :return: Dicionário com { 'pagina', 'por_pagina', 'total', 'total_filtrado', 'linhas' }.
+    """
+    total = len(df)
+    if busca:
+        df = df[df['palavra'].str.contains(busca, case=False, regex=False)]
+    if ordenar_por in COLUNAS_TABELA:
+        df = df.sort_values(ordenar_por, ascending=(ordem == "asc"), kind='stable')
+    por_pagina = max(1, min(int(por_pagina), 500))
+    pagina = max(1, int(pagina))
+    inicio = (pagina - 1) * por_pagina
+    return {
+        "pagina": pagina,
+        "por_pagina": por_pagina,
+        "total": total,
+        "total_filtrado": len(df),
+        "linhas": df.iloc[inicio:inicio + por_pagina][COLUNAS_TABELA].to_dict(orient='records')
+    }
+
+
+def modelo_do_formulario(request_form, nlp):
+    """
+    Retorna o modelo spaCy a usar quando o formulário pede o modo por lemas
+    ('modo=lemas'); caso contrário, None (contagem por formas de superfície).
+    :param nlp: Modelo spaCy ou função sem argumentos que o retorna, chamada só
+        no modo por lemas (o modo por formas não carrega modelo).
+    """
+    if request_form.get('modo', 'formas') != 'lemas':
+        return None
+    return nlp() if callable(nlp) and not hasattr(nlp, "pipe") else nlp
+
+
+def process_representacao_social(text, request_form, upload_folder, db_path=None, nlp=None):
     """
     Processa a análise de Representação Social.
     :param text: Texto para análise.
     :param request_form: Formulário com os filtros.
     :param upload_folder: Caminho para salvar arquivos gerados.
+    :param db_path: DB usado para persistir a tabela base entre execuções (opcional).
+    :param nlp: Modelo spaCy (ou função que o retorna) usado quando o formulário pede 'modo=lemas' (opcional).
     :return: Dicionário com { 'html': ..., 'caminhos_imagens': ..., 'conteudos_tabelas': ... }
     """
-    textos = nltk.sent_tokenize(text)
     aplicar_filtro = request_form.get('extra_filter', 'nao') == 'sim'
-    analise = RepresentacaoSocial(textos, aplicar_filtro=aplicar_filtro)
+    resultado = obter_tabela_evocacoes(
+        text, aplicar_filtro=aplicar_filtro, db_path=db_path,
+        nlp=modelo_do_formulario(request_form, nlp)
+    )
+    return renderizar_representacao_social(resultado, request_form, upload_folder)
+
+
+def process_questionario(arquivo, nome, request_form, upload_folder):
+    """
+    Processa a análise prototípica de um questionário de associação livre.
+    :param arquivo: Objeto de arquivo enviado (CSV ou XLSX).
+    :param nome: Nome original do arquivo.
+    :param request_form: Formulário com os filtros e o layout do arquivo
+        ('formato', 'coluna_respondente', 'coluna_palavra', 'coluna_ordem', 'separador').
+    :param upload_folder: Caminho para salvar arquivos gerados.
+    :return: Mesmo dicionário de process_representacao_social.
+    """
+    analise = carregar_questionario(
+        arquivo,
+        nome=nome,
+        formato=request_form.get('formato', 'larga'),
+        coluna_respondente=request_form.get('coluna_respondente') or None,
+        coluna_palavra=request_form.get('coluna_palavra', 'palavra'),
+        coluna_ordem=request_form.get('coluna_ordem', 'ordem'),
+        separador=request_form.get('separador', ',') or ','
+    )
     resultado = analise.calcular_frequencia_ome()
+    return renderizar_representacao_social(resultado, request_form, upload_folder)
 
-    # ------ Ajustes no filtro de stopwords ------
-    stopwords_filter = request_form.get('stopwords', 'com')
-    stopwords_list = set(stopwords.words('portuguese'))
-
-    if stopwords_filter == "com":
-        palavras = resultado
-    elif stopwords_filter == "sem":
-        palavras = resultado[~resultado['palavra'].isin(stopwords_list)]
-    elif stopwords_filter == "stopwords":
-        palavras = resultado[resultado['palavra'].isin(stopwords_list)]
-    else:
-        palavras = resultado
 
-    # ------ Ajustes no filtro de zonas ------
-    zone_filter = request_form.get('zone', 'todas')
-    zonas = ["Núcleo Central", "Zona Periférica 1", "Zona Periférica 2", "Zona Periférica 3"]
-    graficos_tabelas = []
+def process_similitude(text, request_args, nlp=None):
+    """
+    Processa a análise de similitude do texto, tratando cada frase como um respondente.
+    :param text: Texto para análise.
+    :param request_args: Parâmetros (extra_filter, modo, stopwords, n_palavras, indice, min_coocorrencia).
+    :param nlp: Modelo spaCy (ou função que o retorna) usado quando os parâmetros pedem 'modo=lemas' (opcional).
+    :return: Dicionário com { 'indice', 'vertices', 'arestas' }.
+    :raises ValueError: Se o texto não tiver nenhuma palavra após os filtros.
+    """
+    aplicar_filtro = request_args.get('extra_filter', 'nao') == 'sim'
+    analise = RepresentacaoSocial(
+        nltk.sent_tokenize(text), aplicar_filtro=aplicar_filtro,
+        nlp=modelo_do_formulario(request_args, nlp)
+    )
+    if len(analise.palavra_ids) == 0:
+        raise ValueError("Nenhuma palavra para a análise de similitude após os filtros aplicados.")
+    excluir = _stopwords_portugues() if request_args.get('stopwords', 'com') == 'sem' else None
+    return analise.calcular_similitude(
+        n_palavras=int(request_args.get('n_palavras', 50)),
+        indice=request_args.get('indice', 'cosseno'),
+        min_coocorrencia=int(request_args.get('min_coocorrencia', 1)),
+        excluir=excluir
+    )
 
-    if zone_filter == "todas":
-        for zona in zonas:
-            zona_dados = palavras[palavras['zona'] == zona]
-            grafico_path = analise.gerar_grafico(zona_dados, stopwords_filter, zona, upload_folder)
-            html_tabela = zona_dados.to_html(classes='table table-striped', index=False)
-            graficos_tabelas.append({
-                "zona": zona,
-                "tabela": html_tabela,
-                "grafico": grafico_path
-            })
-    else:
-        zona_dados = palavras[palavras['zona'] == zone_filter]
-        grafico_path = analise.gerar_grafico(zona_dados, stopwords_filter, zone_filter, upload_folder)
-        html_tabela = zona_dados.to_html(classes='table table-striped', index=False)
-        graficos_tabelas.append({
-            "zona": zone_filter,
-            "tabela": html_tabela,
-            "grafico": grafico_path
-        })
+
+def process_representacao_social_corpus(db_paths, request_form, upload_folder, nlp=None):
+    """
+    Processa a análise de Representação Social sobre todos os conteúdos ingeridos
+    nos DBs informados, reaproveitando os agregados já calculados.
+    :param db_paths: Lista de caminhos de DB.
+    :param request_form: Formulário com os filtros.
+    :param upload_folder: Caminho para salvar arquivos gerados.
+    :param nlp: Modelo spaCy (ou função que o retorna) usado quando o formulário pede 'modo=lemas' (opcional).
+    :return: Mesmo dicionário de process_representacao_social.
+    """
+    aplicar_filtro = request_form.get('extra_filter', 'nao') == 'sim'
+    resultado = agregar_corpus(
+        db_paths, aplicar_filtro=aplicar_filtro, nlp=modelo_do_formulario(request_form, nlp)
+    ).tabela()
+    return renderizar_representacao_social(resultado, request_form, upload_folder)
+
+
+def renderizar_representacao_social(resultado, request_form, upload_folder):
+    """
+    Aplica os filtros de stopwords e zonas sobre a tabela base e gera gráficos e tabelas.
+    :param resultado: Tabela base de evocações.
+    :param request_form: Formulário com os filtros.
+    :param upload_folder: Caminho para salvar arquivos gerados.
+    :return: Dicionário com { 'html': ..., 'caminhos_imagens': ..., 'conteudos_tabelas': ... }.
+        'conteudos_tabelas' (gravado por /save_to_db) traz as tabelas HTML separadas por
+        ';' ou, com 'tabela=paginada', a tabela filtrada em JSON compacto (orient='split').
+    """
+    # ------ Ajustes nos filtros de stopwords e zonas ------
+    stopwords_filter = request_form.get('stopwords', 'com')
+    palavras, zonas = filtrar_tabela(resultado, request_form)
+    # Com 'tabela=paginada' o HTML leva só o cabeçalho; as linhas vêm de /representacao_social/tabela
+    tabela_paginada = request_form.get('tabela', 'html') == 'paginada'
+
+    # Linhas de corte do método: medianas da tabela base, as mesmas usadas nas zonas
+    freq_corte = float(resultado['frequencia'].median()) if not resultado.empty else 0.0
+    ome_corte = float(resultado['OME'].median()) if not resultado.empty else 0.0
 
     html = ""
     caminhos_imagens = []
     conteudos_tabelas = []
+    resposta = {}
 
-    for item in graficos_tabelas:
+    if request_form.get('grafico', 'imagem') == 'json':
+        resposta["pontos"] = palavras.to_dict(orient='records')
+        resposta["cortes"] = {"frequencia": freq_corte, "OME": ome_corte}
+    elif not palavras.empty:
+        grafico_path = RepresentacaoSocial.gerar_grafico_quadrantes(
+            palavras, freq_corte, ome_corte, stopwords_filter, upload_folder
+        )
+        caminhos_imagens.append(grafico_path)
         html += f"""
         <div class="zona-section">
-            <h4>{item['zona']}</h4>
-            <img src="{item['grafico']}" style="width: 100%; margin-bottom: 10px;" class="img-fluid">
-            <div>{item['tabela']}</div>
+            <h4>Quadrantes</h4>
+            <img src="{grafico_path}" style="width: 100%; margin-bottom: 10px;" class="img-fluid">
         </div>
         <hr>
         """
-        caminhos_imagens.append(item['grafico'])
-        conteudos_tabelas.append(item['tabela'])
 
-    return {
+    for zona in zonas:
+        zona_dados = palavras[palavras['zona'] == zona]
+        if zona_dados.empty:
+            continue
+        if tabela_paginada:
+            cabecalho = "".join(f"<th>{coluna}</th>" for coluna in COLUNAS_TABELA)
+            html_tabela = (f'<table class="table table-striped rs-tabela-paginada" data-zona="{zona}">'
+                           f'<thead><tr>{cabecalho}</tr></thead></table>')
+        else:
+            html_tabela = zona_dados.to_html(classes='table table-striped', index=False)
+        html += f"""
+        <div class="zona-section">
+            <h4>{zona}</h4>
+            <div>{html_tabela}</div>
+        </div>
+        <hr>
+        """
+        if not tabela_paginada:
+            conteudos_tabelas.append(html_tabela)
+    if tabela_paginada and not palavras.empty:
+        # As linhas não vão no HTML, mas a análise salva precisa delas para ser reproduzida
+        conteudos_tabelas.append(palavras[COLUNAS_TABELA].to_json(orient='split', index=False,
+                                                                  force_ascii=False))
+
+    resposta.update({
         "html": html,
         "caminhos_imagens": ";".join(caminhos_imagens),
         "conteudos_tabelas": ";".join(conteudos_tabelas)
-    }
+    })
+    return resposta
@@ -0,0 +1,119 @@
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# Pool de processos compartilhado para trabalho pesado em CPU (ex.: sumarização BERT),
+# usado via executar_em_processo.
+# Um único worker persistente: o modelo é carregado uma vez nesse processo e reaproveitado.
+# O worker é criado com "spawn": um fork de um processo Flask com threads e com
+# torch/tokenizers carregados pode herdar locks presos e travar.
+_process_pool = None
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """
+    Encerra o pool de processos compartilhado (o próximo uso cria outro).
+    """
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def executar_em_processo(funcao, *args):
+    """
+    Roda funcao(*args) no worker do pool de processos e espera o resultado.
+    Se o worker morrer (ex.: falta de memória), tenta uma vez num pool novo; o modelo
+    continua carregado só no worker, nunca no processo principal.
+    """
+    for tentativa in range(2):
+        try:
+            return _get_process_pool().submit(funcao, *args).result()
+        except BrokenProcessPool as e:
+            shutdown_process_pool()
+            if tentativa:
+                raise
+            print(f">>> [ETAPAS] Pool de processos quebrado ({e}); tentando num worker novo.")
+
+
+def _cronometrar(funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+class Etapa:
+    """
+    Etapa de um pipeline: 'funcao' é chamada com os argumentos fixos 'args' seguidos
+    dos resultados das etapas listadas em 'dependencias', nessa ordem.
+    As etapas rodam em threads; trabalho pesado em CPU pode ir para o pool de processos
+    de dentro da própria função, via executar_em_processo.
+    """
+    def __init__(self, nome, funcao, dependencias=(), args=()):
+        self.nome = nome
+        self.funcao = funcao
+        self.dependencias = tuple(dependencias)
+        self.args = tuple(args)
+
+
+class StageExecutor:
+    """
+    Executa um conjunto de etapas respeitando as dependências entre elas:
+    cada etapa é disparada assim que todas as suas dependências terminam, de modo
+    que etapas independentes rodam em paralelo. Registra o tempo de cada etapa.
+    """
+    def __init__(self, etapas, max_threads=4):
+        self.etapas = {etapa.nome: etapa for etapa in etapas}
+        self.max_threads = max_threads
+        self.tempos = {}
+        for etapa in etapas:
+            for dep in etapa.dependencias:
+                if dep not in self.etapas:
+                    raise ValueError(f"Etapa '{etapa.nome}' depende de etapa inexistente '{dep}'")
+
+    def _submeter(self, threads, etapa, resultados):
+        args = etapa.args + tuple(resultados[d] for d in etapa.dependencias)
+        return threads.submit(_cronometrar, etapa.funcao, *args)
+
+    def executar(self):
+        """
+        Roda todas as etapas e retorna {nome_da_etapa: resultado}.
+        Se uma etapa falhar, as pendentes são canceladas e a exceção é propagada.
+        Os tempos (em segundos) ficam em self.tempos.
+        """
+        resultados = {}
+        pendentes = dict(self.etapas)
+        em_execucao = {}
+        inicio_total = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_threads) as threads:
+            while pendentes or em_execucao:
+                prontas = [e for e in pendentes.values()
+                           if all(d in resultados for d in e.dependencias)]
+                for etapa in prontas:
+                    del pendentes[etapa.nome]
+                    em_execucao[self._submeter(threads, etapa, resultados)] = etapa.nome
+                if not em_execucao:
+                    raise ValueError(f"Dependências cíclicas entre as etapas: {sorted(pendentes)}")
+
+                concluidas, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+                for futuro in concluidas:
+                    nome = em_execucao.pop(futuro)
+                    try:
+                        resultados[nome], self.tempos[nome] = futuro.result()
+                    except Exception:
+                        for restante in em_execucao:
+                            restante.cancel()
+                        raise
+
+        self.tempos["total"] = time.perf_counter() - inicio_total
+        print(">>> [ETAPAS] Tempos: " + ", ".join(f"{n}={t:.2f}s" for n, t in self.tempos.items()))
+        return resultados
@@ -0,0 +1,137 @@
+import os
+import re
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from modules.db_manager import calculate_hash
+from modules.doc_processing import dividir_em_blocos
+from modules.model_registry import get_model
+from modules.persistent_cache import PersistentCache
+from modules.stage_executor import executar_em_processo
+
+# Modos de resumo: "bert" (bert-extractive-summarizer, em blocos para textos longos)
+# e "rapido" (TextRank sobre TF-IDF, só NumPy/scikit-learn). Ambos são extrativos.
+MODOS_RESUMO = ("bert", "rapido")
+MODO_RESUMO_PADRAO = os.getenv("SUMMARY_MODE", "bert")
+
+# Resumo BERT no worker do pool de processos (o modelo fica carregado só nele)
+RESUMO_EM_PROCESSO = os.getenv("SUMMARY_IN_PROCESS", "1") != "0"
+
+# Textos maiores que isso são resumidos por blocos (map) e depois resumidos de novo (reduce)
+MAX_CHARS_BERT = 20_000
+
+# Níveis de reduce pelo BERT antes de recorrer ao TextRank
+MAX_NIVEIS_REDUCE = 5
+
+_FRASE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+|$)", re.MULTILINE)
+
+_cache = None
+
+
+def _cache_resumos():
+    global _cache
+    if _cache is None:
+        _cache = PersistentCache("resumos", ttl=90 * 24 * 3600)
+    return _cache
+
+
+def dividir_frases(text):
+    """
+    Segmentação leve de frases por pontuação final e quebras de linha.
+    """
+    return [f.strip() for f in _FRASE_RE.findall(text) if len(f.strip()) > 1]
+
+
+def textrank(frases, damping=0.85, max_iter=100, tol=1e-6):
+    """
+    Centralidade TextRank das frases: PageRank sobre o grafo de similaridade
+    cosseno entre os vetores TF-IDF das frases.
+    A matriz de similaridade S = X @ X.T não é materializada: os produtos S @ v são
+    feitos como X @ (X.T @ v), em memória proporcional ao TF-IDF esparso.
+    :return: np.ndarray com um escore por frase.
+    """
+    n = len(frases)
+    if n < 3:
+        return np.ones(n)
+    try:
+        X = TfidfVectorizer().fit_transform(frases)
+    except ValueError:
+        # Vocabulário vazio (só números/pontuação)
+        return np.ones(n)
+    # Linhas do TF-IDF têm norma L2 = 1 (ou 0), então diag(S) = norma² e S @ v é a soma dos cossenos
+    diagonal = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    grau = X @ np.asarray(X.sum(axis=0)).ravel() - diagonal
+    sem_vizinhos = grau <= 1e-12
+    inv_grau = np.divide(1.0, grau, out=np.zeros(n), where=~sem_vizinhos)
+
+    escores = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        # Passo de PageRank: (S - I) D^-1 e, com as frases sem vizinhos distribuídas uniformemente
+        peso = escores * inv_grau
+        propagado = X @ (X.T @ peso) - diagonal * peso
+        propagado += escores[sem_vizinhos].sum() / n
+        novos = (1 - damping) / n + damping * propagado
+        if np.abs(novos - escores).sum() < tol:
+            escores = novos
+            break
+        escores = novos
+    return escores
+
+
+def resumo_rapido(text, ratio=0.2, num_frases=None):
+    """
+    Resumo extrativo por TextRank: as frases mais centrais, na ordem original.
+    """
+    frases = dividir_frases(text)
+    if not frases:
+        return ""
+    k = num_frases or max(1, int(round(len(frases) * ratio)))
+    if k >= len(frases):
+        return " ".join(frases)
+    escolhidas = np.sort(np.argsort(-textrank(frases), kind="stable")[:k])
+    return " ".join(frases[i] for i in escolhidas)
+
+
+def resumo_bert(text, ratio=0.2, max_chars=MAX_CHARS_BERT, nivel=0):
+    """
+    Resumo com o BERT Summarizer. Textos longos são divididos em blocos por parágrafo,
+    resumidos separadamente (map) e os resumos concatenados são resumidos de novo (reduce).
+    Se um nível não encurtar o texto, ou após MAX_NIVEIS_REDUCE níveis, o reduce final
+    é feito pelo TextRank (resumo_rapido), que não depende do tamanho da entrada.
+    """
+    modelo = get_model("summarizer")
+    if len(text) <= max_chars:
+        return modelo(text, ratio=ratio)
+    parciais = [modelo(bloco, ratio=ratio) for _, bloco in dividir_em_blocos(text, max_chars)]
+    juntos = "\n\n".join(p for p in parciais if p.strip())
+    if len(juntos) >= len(text) or nivel + 1 >= MAX_NIVEIS_REDUCE:
+        print(f">>> [RESUMO] {len(parciais)} bloco(s) resumidos sem redução suficiente; reduzindo por TextRank...")
+        return resumo_rapido(juntos, ratio=min(1.0, max_chars / max(len(juntos), 1)))
+    print(f">>> [RESUMO] {len(parciais)} bloco(s) resumidos; reduzindo...")
+    return resumo_bert(juntos, ratio=ratio, max_chars=max_chars, nivel=nivel + 1)
+
+
+def resumir(text, modo=None, ratio=0.2, em_processo=None):
+    """
+    Resumo extrativo com cache persistente por (hash do texto, modo, ratio).
+    :param modo: "bert" ou "rapido"; padrão em SUMMARY_MODE.
+    :param em_processo: Se True, o resumo BERT roda no worker do pool de processos;
+                        padrão em SUMMARY_IN_PROCESS.
+    :return: String com frases do próprio texto.
+    """
+    modo = modo or MODO_RESUMO_PADRAO
+    if modo not in MODOS_RESUMO:
+        raise ValueError(f"Modo de resumo inválido: {modo}")
+    chave = (calculate_hash(text), modo, ratio)
+    cache = _cache_resumos()
+    resumo = cache.get(chave)
+    if resumo is not None:
+        return resumo
+
+    if modo == "rapido":
+        resumo = resumo_rapido(text, ratio=ratio)
+    elif RESUMO_EM_PROCESSO if em_processo is None else em_processo:
+        resumo = executar_em_processo(resumo_bert, text, ratio)
+    else:
+        resumo = resumo_bert(text, ratio=ratio)
+    cache.set(chave, resumo)
+    return resumo
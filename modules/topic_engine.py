@@ -0,0 +1,129 @@
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import silhouette_score
+from spacy.lang.pt.stop_words import STOP_WORDS
+from modules.db_manager import calculate_hash
+from modules.embedding_store import get_embedding_store
+from modules.persistent_cache import PersistentCache
+
+# Representações aceitas: "tfidf" (esparsa, sem modelo) ou "embeddings" (Sentence-BERT)
+REPRESENTACOES = ("tfidf", "embeddings")
+
+# Amostra máxima usada no silhouette ao escolher k automaticamente
+AMOSTRA_SILHOUETTE = 2000
+
+_cache = None
+
+
+def _cache_topicos():
+    global _cache
+    if _cache is None:
+        _cache = PersistentCache("topicos", ttl=90 * 24 * 3600)
+    return _cache
+
+
+def vetorizar(frases, representacao="tfidf"):
+    """
+    Vetoriza as frases: TF-IDF esparso com stopwords em português, ou embeddings
+    do Sentence-BERT (lidos do EmbeddingStore; só frases novas passam pelo modelo),
+    normalizados (norma L2 = 1) em ambos os casos.
+    """
+    if representacao == "embeddings":
+        X = get_embedding_store().codificar(frases)
+        normas = np.linalg.norm(X, axis=1, keepdims=True)
+        return X / np.where(normas > 0, normas, 1.0)
+    return TfidfVectorizer(max_features=5000, stop_words=list(STOP_WORDS)).fit_transform(frases)
+
+
+def _normas_quadradas(X):
+    if hasattr(X, "multiply"):
+        return np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    return np.einsum("ij,ij->i", X, X)
+
+
+def distancias_centroides(X, centroides):
+    """
+    Distâncias euclidianas ao quadrado de cada linha de X a cada centroide, sem
+    densificar X: ||x||² - 2 x·c + ||c||².
+    :return: np.ndarray (n_frases, n_clusters)
+    """
+    produto = np.asarray(X @ centroides.T)
+    normas_c = np.einsum("ij,ij->i", centroides, centroides)
+    return np.maximum(_normas_quadradas(X)[:, None] - 2 * produto + normas_c[None, :], 0.0)
+
+
+def _kmeans(X, k):
+    return MiniBatchKMeans(n_clusters=k, random_state=42, n_init=3,
+                           batch_size=1024).fit(X)
+
+
+def escolher_k(X, max_k=8):
+    """
+    Escolhe o número de clusters entre 2 e max_k pelo maior silhouette
+    (calculado sobre uma amostra de até AMOSTRA_SILHOUETTE frases).
+    """
+    n = X.shape[0]
+    candidatos = range(2, min(max_k, n - 1) + 1)
+    if not candidatos:
+        return min(2, n)
+    melhor_k, melhor_escore = candidatos[0], -1.0
+    for k in candidatos:
+        rotulos = _kmeans(X, k).labels_
+        if len(np.unique(rotulos)) < 2:
+            continue
+        escore = silhouette_score(X, rotulos, sample_size=min(n, AMOSTRA_SILHOUETTE), random_state=42)
+        if escore > melhor_escore:
+            melhor_k, melhor_escore = k, escore
+    return melhor_k
+
+
+def _montar_resultado(frases, rotulos, indices_representantes):
+    """
+    Agrupa as frases por cluster (na ordem de primeira aparição de cada cluster).
+    """
+    clusters = {}
+    for frase, c in zip(frases, rotulos):
+        clusters.setdefault(int(c), []).append(frase)
+    return {
+        "k": len(clusters),
+        "rotulos": [int(c) for c in rotulos],
+        "clusters": clusters,
+        "representantes": [frases[indices_representantes[str(c)]] for c in clusters]
+    }
+
+
+def extrair_topicos(frases, representacao="tfidf", k=None, max_k=8):
+    """
+    Agrupa frases em tópicos com MiniBatchKMeans e escolhe, para cada tópico,
+    a frase mais próxima do centroide. Resultado em cache pelo hash das frases.
+    :param frases: Lista de frases (ao menos 2).
+    :param representacao: "tfidf" ou "embeddings".
+    :param k: Número de tópicos; None escolhe automaticamente (até max_k).
+    :return: Dicionário com 'k', 'rotulos', 'clusters' {id: [frases]} e 'representantes'.
+    """
+    if representacao not in REPRESENTACOES:
+        raise ValueError(f"Representação inválida: {representacao}")
+    chave = (calculate_hash("\n".join(frases)), representacao, k, max_k)
+    cache = _cache_topicos()
+    em_cache = cache.get(chave)
+    if em_cache is not None:
+        return _montar_resultado(frases, em_cache["rotulos"], em_cache["representantes"])
+
+    try:
+        X = vetorizar(frases, representacao)
+    except ValueError:
+        # Vocabulário vazio (frases só com stopwords/pontuação): um único tópico
+        return _montar_resultado(frases, [0] * len(frases), {"0": 0})
+    k = min(k or escolher_k(X, max_k), len(frases))
+    modelo = _kmeans(X, k)
+    rotulos = modelo.labels_
+    distancias = distancias_centroides(X, modelo.cluster_centers_)
+
+    indices_representantes = {}
+    for c in np.unique(rotulos):
+        membros = np.flatnonzero(rotulos == c)
+        indices_representantes[str(int(c))] = int(membros[np.argmin(distancias[membros, c])])
+
+    cache.set(chave, {"rotulos": [int(c) for c in rotulos], "representantes": indices_representantes})
+    return _montar_resultado(frases, rotulos, indices_representantes)
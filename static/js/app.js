@@ -476,8 +476,43 @@ $(document).ready(function () {
         });
     });
 
+    // Tabelas de evocação paginadas no servidor (/representacao_social/tabela)
+    function initTabelaPaginada(table, filtros) {
+        const colunas = table.find('thead th').map(function () { return $(this).text(); }).get();
+        table.DataTable({
+            serverSide: true,
+            processing: true,
+            pageLength: 25,
+            order: [[colunas.indexOf('frequencia'), 'desc']],
+            columns: colunas.map(c => ({ data: c })),
+            ajax: function (params, callback) {
+                const ordem = params.order.length ? params.order[0] : { column: 1, dir: 'desc' };
+                $.get('/representacao_social/tabela', {
+                    ...filtros,
+                    zone: table.data('zona'),
+                    pagina: Math.floor(params.start / params.length) + 1,
+                    por_pagina: params.length,
+                    ordenar_por: colunas[ordem.column],
+                    ordem: ordem.dir,
+                    busca: params.search.value
+                }).done(function (resp) {
+                    callback({
+                        draw: params.draw,
+                        recordsTotal: resp.total,
+                        recordsFiltered: resp.total_filtrado,
+                        data: resp.linhas
+                    });
+                }).fail(function () {
+                    alert("Erro ao carregar tabela de evocações.");
+                });
+            }
+        });
+    }
+
     $('#contentBtn').on('click', function () {
         const formData = new FormData($('#contentForm')[0]);
+        formData.append('tabela', 'paginada');
+        const filtros = Object.fromEntries(formData.entries());
         $.ajax({
             url: '/process',
             type: 'POST',
@@ -487,15 +522,8 @@ $(document).ready(function () {
             success: function (resp) {
                 if (typeof resp === 'object' && resp.html) {
                     $('#contentResults').html(resp.html);
-                    $('#contentResults table').each(function () {
-                        const colCount = $(this).find('thead th').length;
-                        if (colCount > 0) {
-                            $(this).DataTable({
-                                paging: false,
-                                info: false,
-                                searching: false
-                            });
-                        }
+                    $('#contentResults table.rs-tabela-paginada').each(function () {
+                        initTabelaPaginada($(this), filtros);
                     });
                 } else {
                     alert("Retorno inesperado da representação social.");
@@ -507,6 +535,29 @@ $(document).ready(function () {
         });
     });
 
+    $('#questionarioBtn').on('click', function () {
+        const formData = new FormData($('#questionarioForm')[0]);
+        new FormData($('#contentForm')[0]).forEach((valor, chave) => formData.append(chave, valor));
+        $.ajax({
+            url: '/ingest_questionario',
+            type: 'POST',
+            data: formData,
+            processData: false,
+            contentType: false,
+            success: function (resp) {
+                if (typeof resp === 'object' && resp.html) {
+                    $('#contentResults').html(resp.html);
+                    $('#contentResults table').DataTable({ paging: true, info: false });
+                } else {
+                    alert("Retorno inesperado da análise do questionário.");
+                }
+            },
+            error: function (xhr) {
+                alert((xhr.responseJSON && xhr.responseJSON.error) || "Erro ao processar questionário.");
+            }
+        });
+    });
+
     $('#sentimentBtn').on('click', function () {
         const formData = new FormData($('#sentimentForm')[0]);
         $.ajax({
@@ -553,6 +604,63 @@ $(document).ready(function () {
         });
     });
 
+    // Mapa Leaflet das entidades: pontos em GeoJSON, agrupados no servidor conforme o zoom
+    let mapaEntidades = null;
+    let camadaEntidades = null;
+
+    function popupEntidade(p) {
+        if (p.cluster) {
+            return `<strong>${p.quantidade} localizações</strong><br>` +
+                   `Ocorrências: ${p.ocorrencias}<br>` +
+                   `Sentimento médio: ${p.sentimento.toFixed(2)}<br>` +
+                   p.entidades.join(', ');
+        }
+        return `Entidade: ${p.entidade}<br>` +
+               `Tipo: ${p.tipo}<br>` +
+               `Local Esperado: ${p.local}<br>` +
+               `Ocorrências: ${p.ocorrencias}<br>` +
+               `Sentimento: ${p.sentimento.toFixed(2)}`;
+    }
+
+    function atualizarMapaEntidades() {
+        const b = mapaEntidades.getBounds();
+        $.getJSON('/entities/geojson', {
+            zoom: mapaEntidades.getZoom(),
+            bbox: [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()].join(',')
+        }, function (geojson) {
+            if (camadaEntidades) {
+                mapaEntidades.removeLayer(camadaEntidades);
+            }
+            camadaEntidades = L.geoJSON(geojson, {
+                pointToLayer: function (feature, latlng) {
+                    const p = feature.properties;
+                    if (p.cluster) {
+                        return L.circleMarker(latlng, {radius: 8 + Math.min(Math.sqrt(p.quantidade) * 3, 22)});
+                    }
+                    return L.marker(latlng, {title: `${p.entidade} - ${p.tipo}`});
+                },
+                onEachFeature: function (feature, layer) {
+                    layer.bindPopup(popupEntidade(feature.properties));
+                }
+            }).addTo(mapaEntidades);
+        });
+    }
+
+    function carregarMapaEntidades() {
+        $('#mapContainer').show();
+        if (!mapaEntidades) {
+            // Posição inicial "genérica" centrada no Brasil
+            mapaEntidades = L.map('mapContainer').setView([-15.0, -50.0], 4);
+            L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png', {
+                maxZoom: 19,
+                attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+            }).addTo(mapaEntidades);
+            mapaEntidades.on('moveend', atualizarMapaEntidades);
+        }
+        mapaEntidades.invalidateSize();
+        atualizarMapaEntidades();
+    }
+
     $('#identifyEntitiesBtn').on('click', function () {
         $.ajax({
             url: '/identify_entities',
@@ -560,26 +668,20 @@ $(document).ready(function () {
             success: function (data) {
                 if (data.status === "success") {
                     $('#entitiesResults').html(renderEntities(data.entities));
-                    if (data.entities.map_html) {
-                        $('#mapContainer').html(data.entities.map_html);
-                    }
+                    carregarMapaEntidades();
                 } else if (data.status === "cached") {
                     if (typeof data.entities === "string") {
                         try {
                             let obj = JSON.parse(data.entities);
                             $('#entitiesResults').html(renderEntities(obj));
-                            if (obj.map_html) {
-                                $('#mapContainer').html(obj.map_html);
-                            }
                         } catch (e) {
                             $('#entitiesResults').html(`<pre>${data.entities}</pre>`);
                         }
                     } else {
                         $('#entitiesResults').html(renderEntities(data.entities));
-                        if (data.entities.map_html) {
-                            $('#mapContainer').html(data.entities.map_html);
-                        }
                     }
+                    // O GeoJSON vem do servidor (/entities/geojson) em qualquer formato do cache
+                    carregarMapaEntidades();
                 } else {
                     alert("Erro ao identificar entidades.");
                 }
@@ -608,6 +710,7 @@ $(document).ready(function () {
                 html += `
                     <li class="entidade">
                         <strong>${pessoa.entidade}</strong>
+                        ${pessoa.ocorrencias > 1 ? `<span class="ocorrencias">(${pessoa.ocorrencias}×)</span>` : ''}
                         <span class="emoji">
                             ${pessoa.sentimento > 0.05 ? '😊' : pessoa.sentimento < -0.05 ? '😠' : '😐'}
                         </span>
@@ -623,6 +726,7 @@ $(document).ready(function () {
                 html += `
                     <li class="entidade">
                         <strong>${loc.entidade}</strong>
+                        ${loc.ocorrencias > 1 ? `<span class="ocorrencias">(${loc.ocorrencias}×)</span>` : ''}
                         <span class="emoji">
                             ${loc.sentimento > 0.05 ? '😊' : loc.sentimento < -0.05 ? '😠' : '😐'}
                         </span>